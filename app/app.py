@@ -1,11 +1,15 @@
 # Import modules
 import os
-import pandas as pd
 import flask.views
-from flask import Flask, render_template, request, redirect, url_for, send_from_directory, send_file
+from flask import Flask, render_template, request, redirect, url_for, send_from_directory, send_file, jsonify, abort
 from werkzeug import secure_filename
-from flask_weasyprint import HTML, render_pdf
-from nlq import clem_lda
+from nlq import clem_lda, model_registry
+from jobs import JobQueue, QueueFull
+from ingest import TooManyRows, BadUpload, ResumableUploads
+from artifacts import ArtifactStore
+from pdfs import ReportStore
+from httpcache import TemplateCache, precompress, send_precompressed
+import columnar
 
 # Initialize the Flask application
 app = Flask(__name__, static_url_path = "", static_folder='static')
@@ -22,42 +26,70 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1] in app.config['ALLOWED_EXTENSIONS']
 
+# Topic modeling runs in a pool of worker processes, not in the request thread
+app.config['LDA_WORKERS'] = 4
+app.config['LDA_MAX_PENDING'] = 16
+# 'gibbs' or 'vb', see engines.py
+app.config['LDA_ENGINE'] = 'gibbs'
+# A number, or 'auto' to pick it per file with a sweep (model_selection.py).
+# The sweep runs its stages in a pool of its own inside the job's worker, so
+# it takes about one full fit with a core per topic count, and several times
+# that on fewer cores (5x on one core for the 8 counts of nlq.TOPIC_COUNTS)
+app.config['LDA_TOPICS'] = 25
+# Larger uploads are turned away, the worker stops reading at this row
+app.config['MAX_ROWS'] = 3100
+# Histogram format, 'png' or 'svg' (see charts.py)
+app.config['CHART_FORMAT'] = 'png'
+lda_jobs = JobQueue(clem_lda, processes=app.config['LDA_WORKERS'],
+                    max_pending=app.config['LDA_MAX_PENDING'])
+
+# Uploads are streamed to disk and checked while they arrive, large files can
+# be sent in chunks of at most MAX_CONTENT_LENGTH bytes (see ingest.py)
+app.config['MAX_CONTENT_LENGTH'] = 16 * 2**20
+app.config['UPLOAD_MAX_BYTES'] = 64 * 2**20
+upload_store = ResumableUploads(app.config['UPLOAD_FOLDER'],
+                                max_rows=app.config['MAX_ROWS'],
+                                max_bytes=app.config['UPLOAD_MAX_BYTES'])
+
+# Static pages are rendered once per template change and sent with an ETag
+pages = TemplateCache()
+
 # Define routes
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return pages.response('index.html')
 
 @app.route('/nlq')
 def nlq():
-    return render_template('index.html')
+    return pages.response('index.html')
 
 @app.route('/tutorial')
 def tutorial():
-    return render_template('tutorial.html')
+    return pages.response('tutorial.html')
 
 @app.route('/projects')
 def projects():
-    return render_template('projects.html')
+    return pages.response('projects.html')
 
 @app.route('/thanks')
 def thanks():
-    return render_template('thanks.html')
+    return pages.response('thanks.html')
 
 @app.route('/education')
 def education():
-    return render_template('education.html')
+    return pages.response('education.html')
 
 @app.route('/clem')
 def clem():
-    return render_template('clem.html')
+    return pages.response('clem.html')
 
 @app.route('/dspipeline_code')
 def dspipeline_code():
-    return render_template('dspipeline_code.html')
+    return pages.response('dspipeline_code.html')
 
 @app.route('/clem_pipeline')
 def clem_pipeline():
-    return render_template('clem_pipeline.html')
+    return pages.response('clem_pipeline.html')
 
 
 
@@ -69,12 +101,61 @@ def predcit():
         return 'File does not exist. Did you upload your file? Did you type in the extension .csv before submitting?'
 
     a = ('uploads/{}'.format(file_name))
-    input_file = pd.read_csv(a)
-    if len(input_file) > 3100:
-        return render_template('index.html')
-    else:
-        z,text_name,f_name = clem_lda(a)
-        return render_template('prediction.html', topics = z, title = text_name, f_name = f_name) 
+    try:
+        job_id = lda_jobs.submit(a, n_topics=app.config['LDA_TOPICS'],
+                                 engine=app.config['LDA_ENGINE'],
+                                 max_rows=app.config['MAX_ROWS'],
+                                 chart_format=app.config['CHART_FORMAT'])
+    except QueueFull:
+        return 'The server is busy analyzing other files, please try again in a minute.', 503
+    return redirect(url_for('result', job_id=job_id))
+
+
+# Report page for a submitted file, refreshes itself until the job is done
+@app.route('/result/<job_id>')
+def result(job_id):
+    status = lda_jobs.status(job_id)
+    if status == 'unknown':
+        abort(404)
+    if status == 'pending':
+        return render_template('processing.html', job_id = job_id)
+    if status == 'failed':
+        try:
+            lda_jobs.result(job_id)
+        except TooManyRows:
+            return render_template('index.html')
+        except Exception:
+            return 'Topic modeling failed on this file. Is the first column a number and the second one text?', 500
+    z,text_name,f_name,aggregates = lda_jobs.result(job_id)
+    return render_template('prediction.html', topics = z, title = text_name, f_name = f_name,
+                           job_id = job_id)
+
+@app.route('/status/<job_id>')
+def status(job_id):
+    status = lda_jobs.status(job_id)
+    if status == 'unknown':
+        abort(404)
+    out = {'job_id': job_id, 'status': status}
+    if status == 'done':
+        z,text_name,f_name,aggregates = lda_jobs.result(job_id)
+        out.update(topics = z, title = text_name,
+                   histogram = url_for('static', filename = f_name))
+    return jsonify(**out)
+
+# Per-topic amounts as numbers, for dashboards that don't want the histogram
+@app.route('/aggregates/<job_id>')
+def aggregates(job_id):
+    if lda_jobs.status(job_id) != 'done':
+        abort(404)
+    z,text_name,f_name,aggregates = lda_jobs.result(job_id)
+    topics = [{'topic': i+1, 'total': total, 'share': share, 'documents': documents,
+               'words': words}
+              for i, (total, share, documents, words) in enumerate(zip(
+                  aggregates['totals'], aggregates['shares'], aggregates['documents'],
+                  aggregates['words']))]
+    return jsonify(title = text_name, number_name = aggregates['number_name'],
+                   total = aggregates['total'], topics = topics,
+                   n_topics_curve = aggregates.get('sweep'))
 
 
 
@@ -90,9 +171,13 @@ def upload():
     if file and allowed_file(file.filename):
         # Make the filename safe, remove unsupported chars
         filename = secure_filename(file.filename)
-        # Move the file form the temporal folder to
-        # the upload folder we setup
-        file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+        # Stream the file into the upload folder, checking rows on the way
+        try:
+            upload_store.save(filename, file.stream)
+        except TooManyRows:
+            return render_template('index.html'), 413
+        except BadUpload as e:
+            return str(e), 400
         # Redirect the user to the uploaded_file route, which
         # will basicaly show on the browser the uploaded file
         #return 1
@@ -100,6 +185,47 @@ def upload():
         return redirect("/")
 
 
+# Chunked, resumable uploads: start one, PUT the bytes in pieces with an
+# Upload-Offset header (GET tells where to resume), then finish it
+@app.route('/upload/start', methods=['POST'])
+def upload_start():
+    filename = secure_filename(request.form.get('filename', ''))
+    if not allowed_file(filename):
+        return 'Only .csv and .txt files can be uploaded.', 400
+    upload_id = upload_store.start(filename)
+    return jsonify(**upload_store.status(upload_id)), 201
+
+@app.route('/upload/<upload_id>', methods=['GET', 'PUT'])
+def upload_chunk(upload_id):
+    try:
+        if request.method == 'GET':
+            return jsonify(**upload_store.status(upload_id))
+        try:
+            offset = int(request.headers.get('Upload-Offset', 0))
+        except ValueError:
+            return 'Upload-Offset should be a number of bytes.', 400
+        return jsonify(**upload_store.append(upload_id, offset, request.stream))
+    except KeyError:
+        abort(404)
+    except TooManyRows as e:
+        return jsonify(error = str(e)), 413
+    except BadUpload as e:
+        # a wrong offset keeps the upload, tell the client where to resume
+        if upload_id in upload_store:
+            return jsonify(error = str(e), **upload_store.status(upload_id)), 409
+        return jsonify(error = str(e)), 400
+
+@app.route('/upload/<upload_id>/finish', methods=['POST'])
+def upload_finish(upload_id):
+    try:
+        path = upload_store.finish(upload_id)
+    except KeyError:
+        abort(404)
+    except (BadUpload, TooManyRows) as e:
+        return jsonify(error = str(e)), 400
+    return jsonify(file_name = os.path.basename(path))
+
+
 # This route is expecting a parameter containing the name
 # of a file. Then it will locate that file on the upload
 # directory and show it on the browser, so if the user uploads
@@ -107,12 +233,12 @@ def upload():
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
     return send_from_directory(app.config['UPLOAD_FOLDER'],
-                               filename)
+                               filename, conditional=True)
 
 @app.route('/return_clean_data/')
 def return_clean_data():
     return send_file('data/clean_data_nlq.py', as_attachment = True, 
-                    attachment_filename = 'clean_data_nlq')
+                    attachment_filename = 'clean_data_nlq', conditional = True)
 
 
 
@@ -121,11 +247,24 @@ def return_clean_data():
 projects_names = ['NSF_chem_2013', 'NSF_bio_2015', 'NSF_cosmology',
                 'NSF_etno', 'NSF_history', 'NSF_politics', 'NSF_plasma', 'NSF_phy_2013']
 
+# Behind nginx/Apache with X-Sendfile the web server sends files itself
+# (kernel sendfile), Flask only sets the header
+app.use_x_sendfile = False
+
+# Dataset downloads also exist gzip (and brotli) compressed next to the csv,
+# and answer Range requests (see httpcache.py). The datasets themselves
+# are analyzed from their memory-mapped column copy (see columnar.py)
+for project in projects_names:
+    if os.path.exists('data/{}.csv'.format(project)):
+        precompress('data/{}.csv'.format(project))
+        if not columnar.fresh('data/{}.csv'.format(project)):
+            columnar.convert('data/{}.csv'.format(project))
+
 @app.route('/return/<name>/')
 def return_name(name):
     if name in projects_names:
-        return send_file('./data/{}.csv'.format(name), as_attachment = True, 
-                        attachment_filename = name)
+        return send_precompressed('./data/{}.csv'.format(name), 'text/csv',
+                                  as_attachment = True, attachment_filename = name)
 
 
 # @app.route('/predict/<name>', methods=['POST'])
@@ -141,25 +280,135 @@ def return_name(name):
 @app.route('/predict/<name>', methods=['POST'])
 def predict_name(name):
     if name in projects_names:
-        return render_template('prediction_{}.html'.format(name))
+        return pages.response('prediction_{}.html'.format(name))
+
+# Topic mixtures of new abstracts under a saved dataset model (build_models.py).
+# Takes JSON {"documents": [...]} or form fields "text".
+@app.route('/infer/<name>', methods=['POST'])
+def infer(name):
+    try:
+        model = model_registry.load(name)
+    except KeyError:
+        abort(404)
+    # silent: None for form posts, newer Flask answers 415 on request.json
+    body = request.get_json(silent=True)
+    if body is None and request.mimetype == 'application/json':
+        abort(400)
+    if body is not None:
+        if not isinstance(body, dict):
+            abort(400)
+        docs = body.get('documents', [])
+        if not isinstance(docs, list) or \
+                not all(isinstance(doc, (str, type(u''))) for doc in docs):
+            abort(400)
+    else:
+        docs = request.form.getlist('text')
+    theta = model.transform(docs)
+    return jsonify(topics = model.topics,
+                   documents = [{'mixture': row.tolist(), 'main_topic': int(row.argmax())+1}
+                                for row in theta])
+
+# Ranked top words of a saved dataset model, ?n=<words>&lambda=<relevance>
+# (1: most likely words, towards 0: words most specific to the topic),
+# 1 <= n <= MAX_TOP_WORDS and 0 <= lambda <= 1
+app.config['MAX_TOP_WORDS'] = 100
+
+@app.route('/topics/<name>')
+def topic_words(name):
+    try:
+        model = model_registry.load(name)
+    except KeyError:
+        abort(404)
+    n = request.args.get('n', model.params.get('n_top_words', 8), type=int)
+    lam = request.args.get('lambda', 1.0, type=float)
+    if not 1 <= n <= app.config['MAX_TOP_WORDS'] or not 0 <= lam <= 1:
+        abort(400)
+    return jsonify(name = name, topics = model.ranked_topics(n, lam))
 
 @app.route('/stat_pdf/<name>')
 def stat_pdf(name):
-    return render_template('prediction_{}.html'.format(name))
+    return pages.response('prediction_{}.html'.format(name))
+
+
+# PDF reports are laid out once into pdfs/ and then served as files,
+# with ETag/Last-Modified and 304 answers to conditional requests. The
+# layout runs in worker processes of its own, not the JobQueue's, so a
+# report does not wait for the topic modeling jobs (see pdfs.py).
+app.config['PDF_WORKERS'] = 1
+pdf_reports = ReportStore(ArtifactStore('pdfs'), app.static_folder,
+                          processes=app.config['PDF_WORKERS'])
+
+def page_html(url, template, **context):
+    """HTML of a template as served at url, also outside of a request."""
+    with app.test_request_context(url):
+        return render_template(template, **context)
+
+def send_pdf(name):
+    pdf_reports.store.touch(name + '.pdf')
+    return send_file(pdf_reports.path(name), mimetype='application/pdf',
+                     conditional=True)
+
+def pdf_pending(job_id=None):
+    return render_template('processing.html', job_id = job_id,
+                           message = 'Your PDF report is being created. This page refreshes '
+                                     'every few seconds and will download it when it is ready.'), 202
 
+def project_template(name):
+    return os.path.join(app.root_path, app.template_folder,
+                        'prediction_{}.html'.format(name))
 
 @app.route('/print_pdf/<name>/')
 def print_pdf(name):
     if name in projects_names:
-        print name
-        return render_pdf('/stat_pdf/{}'.format(name))
+        # laid out at startup, or again if the template changed since
+        if pdf_reports.fresh(name, project_template(name)):
+            return send_pdf(name)
+        status = pdf_reports.status(name)
+        if status == 'failed':
+            return 'The PDF report could not be created.', 500
+        if status is None:
+            url = '/stat_pdf/{}'.format(name)
+            pdf_reports.render_async(name, page_html(url, 'prediction_{}.html'.format(name)), url)
+        return pdf_pending()
+
+# PDF of an uploaded file's report, laid out in the background
+@app.route('/result_pdf/<job_id>')
+def result_pdf(job_id):
+    if lda_jobs.status(job_id) != 'done':
+        abort(404)
+    name = 'job_{}'.format(job_id)
+    if pdf_reports.fresh(name):
+        return send_pdf(name)
+    if pdf_reports.status(name) == 'failed':
+        return 'The PDF report could not be created.', 500
+    z,text_name,f_name,aggregates = lda_jobs.result(job_id)
+    url = '/result/{}'.format(job_id)
+    pdf_reports.render_async(name, page_html(url, 'prediction.html', topics = z,
+                                             title = text_name, f_name = f_name), url)
+    return pdf_pending(job_id)
+
+# The project reports never change, lay them out before anyone asks. On the
+# first request, so in the process that serves them with or without the
+# debug reloader (app.run below also imports this module in its watcher).
+prerendered = []
+
+@app.before_request
+def prerender_reports():
+    if prerendered:
+        return
+    prerendered.append(True)
+    for project in projects_names:
+        if os.path.exists(project_template(project)) and \
+                not pdf_reports.fresh(project, project_template(project)):
+            url = '/stat_pdf/{}'.format(project)
+            pdf_reports.render_async(project, page_html(url, 'prediction_{}.html'.format(project)), url)
 
 
 
 
 @app.route('/dspipeline')
 def dspeipeline():
-    return render_template('dspipeline_home.html')
+    return pages.response('dspipeline_home.html')
 
 class View(flask.views.MethodView):
     def get(self):
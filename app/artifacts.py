@@ -0,0 +1,109 @@
+from __future__ import print_function
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+
+class ArtifactStore(object):
+    """ Summary: Generated files (histograms) under root, named after the
+        sha1 of their content so concurrent requests can never pick the
+        same name, and identical plots are stored once.
+
+        index.json records the size and last use of every file, so naming
+        and eviction never list the directory. It is rewritten under an
+        exclusive lock, which works across the JobQueue worker processes.
+        Files unused for max_age seconds are evicted first, then the least
+        recently used ones until the store fits in max_bytes.
+
+        The index, its lock and files being written live in work (root by
+        default), which should not be served when root is: keep it on the
+        same filesystem so finished files can be renamed into root.
+    """
+
+    def __init__(self, root='static/plots', max_bytes=256 * 2**20,
+                 max_age=30 * 24 * 3600, work=None):
+        self.root = root
+        self.work = work or root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.index_path = os.path.join(self.work, 'index.json')
+        for folder in (root, self.work):
+            if not os.path.isdir(folder):
+                os.makedirs(folder)
+        if self.work != root:
+            # index and lock left in root by a store without a work folder
+            old_index = os.path.join(root, 'index.json')
+            if os.path.exists(old_index) and not os.path.exists(self.index_path):
+                os.rename(old_index, self.index_path)
+            for name in ('index.json', 'index.lock'):
+                if os.path.exists(os.path.join(root, name)):
+                    os.remove(os.path.join(root, name))
+
+    @contextmanager
+    def _index(self):
+        """Yield the index dict, locked, and write it back afterwards."""
+        with open(os.path.join(self.work, 'index.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                with open(self.index_path) as f:
+                    index = json.load(f)
+            except (IOError, ValueError):
+                index = {}
+            yield index
+            fd, tmp = tempfile.mkstemp(dir=self.work, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(index, f)
+            os.rename(tmp, self.index_path)
+
+    def new_file(self, suffix=''):
+        """Path of a fresh temp file in work to write an artifact into."""
+        fd, tmp = tempfile.mkstemp(dir=self.work, suffix=suffix + '.tmp')
+        os.close(fd)
+        return tmp
+
+    def add(self, tmp, ext='.png', key=None):
+        """Move a finished temp file into the store, return its file name.
+
+        The name is the sha1 of the content, or key when given, e.g. a hash
+        of what the file was rendered from so it can be found before
+        rendering it again.
+        """
+        if key is None:
+            h = hashlib.sha1()
+            with open(tmp, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 16), b''):
+                    h.update(chunk)
+            key = h.hexdigest()
+        name = key + ext
+        size = os.path.getsize(tmp)
+        os.rename(tmp, os.path.join(self.root, name))
+        with self._index() as index:
+            index[name] = [size, time.time()]
+            self._evict(index)
+        return name
+
+    def touch(self, name):
+        """Mark a file as used, False if it is no longer in the store."""
+        with self._index() as index:
+            if name not in index:
+                return False
+            index[name][1] = time.time()
+        return True
+
+    def _evict(self, index):
+        oldest_first = sorted(index.items(), key=lambda e: e[1][1])
+        total = sum(size for size, used in index.values())
+        now = time.time()
+        for name, (size, used) in oldest_first:
+            if total <= self.max_bytes and now - used <= self.max_age:
+                break
+            try:
+                os.remove(os.path.join(self.root, name))
+            except OSError:
+                pass
+            del index[name]
+            total -= size
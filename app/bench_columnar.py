@@ -0,0 +1,60 @@
+from __future__ import print_function
+import csv
+import resource
+import sys
+import time
+from multiprocessing import Process, Queue
+import numpy as np
+import columnar
+
+# Load time and RSS of a dataset's two columns: csv.DictReader over the csv
+# against the memory-mapped column copy (written first if missing).
+# Each loader runs in its own process so peak RSS is not shared.
+#   python bench_columnar.py [data/NSF_cosmology.csv]
+
+
+def dictreader(a):
+    f = open(a, 'rb') if str is bytes else open(a, encoding='latin-1', newline='')
+    with f:
+        reader = csv.DictReader(f)
+        number_name, text_name = reader.fieldnames[:2]
+        number = []
+        text = []
+        for row in reader:
+            number.append(float(row[number_name]))
+            text.append(row[text_name])
+    return np.array(number), text
+
+
+def mmap_columns(a):
+    return columnar.Dataset(a).columns()
+
+
+def mmap_numbers(a):
+    # only the amount column, e.g. for totals: the texts are never touched
+    ds = columnar.Dataset(a)
+    return ds.numbers, ()
+
+
+def run(loader, a, out):
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    number, text = loader(a)
+    total = float(np.sum(number))
+    elapsed = time.time() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    out.put((loader.__name__, len(number), elapsed, (peak - base) / 1024., total))
+
+
+if __name__ == '__main__':
+    a = sys.argv[1] if len(sys.argv) > 1 else 'data/NSF_cosmology.csv'
+    if not columnar.fresh(a):
+        columnar.convert(a)
+    out = Queue()
+    for loader in (dictreader, mmap_columns, mmap_numbers):
+        p = Process(target=run, args=(loader, a, out))
+        p.start()
+        p.join()
+        name, rows, elapsed, rss, total = out.get()
+        print('{:<14} {:>6} rows {:>8.1f} ms {:>7.1f} MB peak RSS increase  total {:.1f}'.format(
+            name, rows, elapsed * 1000, rss, total))
@@ -0,0 +1,79 @@
+from __future__ import print_function
+import resource
+import sys
+import time
+from multiprocessing import Process, Queue
+try:
+    from Queue import Empty
+except ImportError:
+    from queue import Empty
+import numpy as np
+from dtm import build_dtm
+from ingest import Upload
+
+# Compare the old textmining dense path with dtm.build_dtm.
+# Each builder runs in its own process so peak RSS is not shared, one that
+# dies (e.g. textmining not installed) is reported and the bench goes on.
+# textmining is Python 2 only, run the bench with python2 to compare both.
+#   python bench_dtm.py [data/NSF_Phy_2013.csv]
+
+
+def read_text(a):
+    return Upload(a).columns()[1]
+
+
+def dense_textmining(text):
+    import textmining
+    tdm = textmining.TermDocumentMatrix()
+    for doc in text:
+        tdm.add_doc(doc)
+    temp = list(tdm.rows(cutoff=1))
+    vocab = tuple(temp[0])
+    X = np.array(temp[1:])
+    return X, vocab
+
+
+def sparse_csr(text):
+    return build_dtm(text)
+
+
+def run(builder, a, out):
+    text = read_text(a)
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    X, vocab = builder(text)
+    elapsed = time.time() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if hasattr(X, 'nnz'):
+        nbytes = X.data.nbytes + X.indices.nbytes + X.indptr.nbytes
+    else:
+        nbytes = X.nbytes
+    out.put((builder.__name__, X.shape, elapsed, (peak - base) / 1024., nbytes / 1e6))
+
+
+if __name__ == '__main__':
+    a = sys.argv[1] if len(sys.argv) > 1 else 'data/NSF_Phy_2013.csv'
+    print('{:<18} {:>16} {:>9} {:>14} {:>11}'.format(
+        'builder', 'shape', 'time (s)', 'peak RSS (MB)', 'matrix (MB)'))
+    failed = 0
+    for builder in (dense_textmining, sparse_csr):
+        out = Queue()
+        p = Process(target=run, args=(builder, a, out))
+        p.start()
+        while True:
+            try:
+                result = out.get(timeout=1)
+                break
+            except Empty:
+                if not p.is_alive():
+                    result = None
+                    break
+        p.join()
+        if result is None:
+            failed += 1
+            print('{:<18} failed, exit code {}'.format(builder.__name__, p.exitcode))
+            continue
+        name, shape, elapsed, peak, nbytes = result
+        print('{:<18} {:>16} {:>9.2f} {:>14.1f} {:>11.1f}'.format(
+            name, '{} x {}'.format(*shape), elapsed, peak, nbytes))
+    sys.exit(1 if failed else 0)
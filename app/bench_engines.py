@@ -0,0 +1,44 @@
+from __future__ import print_function
+import sys
+import tempfile
+import time
+from dtm import build_dtm
+from ingest import Upload
+from engines import ENGINES, make_model
+from topics import umass_coherence
+from cache import ResultCache
+from jobs import JobQueue
+import nlq
+
+# Wall-clock time and topic coherence of each LDA engine on one dataset, fitted
+# here and through clem_lda in a JobQueue worker, the way /predict runs it.
+#   python bench_engines.py [data/NSF_Phy_2013.csv] [n_topics]
+
+
+if __name__ == '__main__':
+    a = sys.argv[1] if len(sys.argv) > 1 else 'data/NSF_Phy_2013.csv'
+    n_topics = int(sys.argv[2]) if len(sys.argv) > 2 else 25
+
+    # the corpus clem_lda fits: nlq's Normalizer, then the count matrix
+    tokens = nlq.normalizer.transform(Upload(a).columns()[1])
+    X, vocab = build_dtm(tokens, tokenizer=None)
+
+    print('{:<6} {:>9} {:>16}'.format('engine', 'time (s)', 'UMass coherence'))
+    for engine in ENGINES:
+        model = make_model(engine, n_topics)
+        start = time.time()
+        model.fit(X)
+        elapsed = time.time() - start
+        coherence = umass_coherence(X, model.topic_word_).mean()
+        print('{:<6} {:>9.1f} {:>16.2f}'.format(engine, elapsed, coherence))
+
+    # results are not cached across runs, the workers fork with this cache
+    nlq.result_cache = ResultCache(tempfile.mkdtemp())
+    jobs = JobQueue(nlq.clem_lda, processes=1)
+    print('clem_lda in a JobQueue worker')
+    print('{:<6} {:>9}'.format('engine', 'time (s)'))
+    for engine in ENGINES:
+        start = time.time()
+        jobs.result(jobs.submit(a, n_topics=n_topics, engine=engine))
+        print('{:<6} {:>9.1f}'.format(engine, time.time() - start))
+    jobs.close()
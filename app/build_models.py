@@ -0,0 +1,21 @@
+from __future__ import print_function
+import glob
+import os
+import sys
+import columnar
+from nlq import clem_lda, model_registry
+
+# Fit and save a topic model per bundled dataset, served by /infer/<name>.
+#   python build_models.py [name ...]
+# Without names, every data/NSF_*.csv except the raw NSF_ZFull_* exports.
+
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or sorted(
+        os.path.basename(p)[:-4] for p in glob.glob('data/NSF_*.csv')
+        if not os.path.basename(p).startswith('NSF_ZFull_'))
+    for name in names:
+        if not columnar.fresh('data/{}.csv'.format(name)):
+            columnar.convert('data/{}.csv'.format(name))
+        clem_lda('data/{}.csv'.format(name), model_name=name)
+        print('saved', name, 'to', model_registry.root)
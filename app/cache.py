@@ -0,0 +1,106 @@
+from __future__ import print_function
+import hashlib
+import json
+import os
+import tempfile
+import numpy as np
+
+# Bump when the cached format or the clem_lda pipeline changes
+CACHE_VERSION = 5
+
+# .npy: single-array entries of versions before 5, evicted like the others
+EXTENSIONS = ('.json', '.npz', '.npy')
+
+
+def file_hash(path, chunk_size=1 << 16):
+    """sha1 of a file's content, read in chunks."""
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ResultCache(object):
+    """ Summary: On-disk cache of clem_lda results, bounded in size with
+        least-recently-used eviction.
+
+        An entry is keyed on the uploaded file's content hash plus the model
+        parameters, and made of two files in root: <key>.json (topics,
+        column names, histogram file name) and <key>.npz (named numpy
+        arrays, e.g. doc_topic). The histogram itself lives in the plot
+        ArtifactStore.
+    """
+
+    def __init__(self, root='cache', max_bytes=256 * 2**20):
+        self.root = root
+        self.max_bytes = max_bytes
+        if not os.path.isdir(root):
+            os.makedirs(root)
+
+    def key(self, digest, **params):
+        """Entry key from a content digest (e.g. file_hash) and parameters."""
+        params['version'] = CACHE_VERSION
+        h = hashlib.sha1(digest.encode('ascii'))
+        h.update(json.dumps(params, sort_keys=True).encode('utf-8'))
+        return h.hexdigest()
+
+    def _path(self, key, ext):
+        return os.path.join(self.root, key + ext)
+
+    def get(self, key):
+        """Return the cached entry as a dict (meta and arrays), or None on a miss."""
+        try:
+            with open(self._path(key, '.json')) as f:
+                entry = json.load(f)
+            with np.load(self._path(key, '.npz')) as arrays:
+                entry.update((name, arrays[name]) for name in arrays.files)
+            # mark as recently used
+            os.utime(self._path(key, '.json'), None)
+        except (IOError, OSError, ValueError):
+            return None
+        return entry
+
+    def _write(self, key, ext, write):
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.rename(tmp, self._path(key, ext))
+
+    def put(self, key, arrays, **meta):
+        """ Summary: Store an entry. The .json goes last so get() never sees
+            half of one.
+            INPUT: string: entry key.
+                   dict: name -> numpy array, may be empty.
+                   json-serializable metadata, as keyword arguments.
+        """
+        self._write(key, '.npz', lambda f: np.savez(f, **arrays))
+        self._write(key, '.json', lambda f: f.write(json.dumps(meta).encode('utf-8')))
+        self.evict()
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits in max_bytes."""
+        entries = {}
+        total = 0
+        for name in os.listdir(self.root):
+            key, ext = os.path.splitext(name)
+            if ext not in EXTENSIONS:
+                continue
+            try:
+                st = os.stat(os.path.join(self.root, name))
+            except OSError:
+                continue
+            # get() touches the .json, so the newest file dates the last use
+            size, used = entries.get(key, (0, 0))
+            entries[key] = (size + st.st_size, max(used, st.st_mtime))
+            total += st.st_size
+
+        for key, (size, used) in sorted(entries.items(), key=lambda e: e[1][1]):
+            if total <= self.max_bytes:
+                break
+            for ext in EXTENSIONS:
+                try:
+                    os.remove(self._path(key, ext))
+                except OSError:
+                    pass
+            total -= size
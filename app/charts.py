@@ -0,0 +1,49 @@
+from __future__ import print_function
+import hashlib
+import json
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+# 'png' (Agg raster) or 'svg' (vector, much cheaper than a 300 dpi PNG).
+# Dashboards can also draw the chart themselves from /aggregates/<job_id>.
+FORMATS = ('png', 'svg')
+
+
+def render_histogram(f, totals, number_name, total, fmt='png', dpi=100):
+    """ Summary: Draw the per-topic totals bar chart into a file object.
+
+        Uses its own Figure and Agg canvas instead of the pyplot state
+        machine, so charts can be drawn from any thread or worker at once.
+    """
+    fig = Figure(figsize=(8, 6))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    x = np.arange(1, len(totals)+1, 1)
+    ax.bar(x, totals, color='Blue', align='center')
+    ax.set_xticks(x)
+    ax.set_xlim(0.5, len(totals)+0.5)
+    ax.set(xlabel='Topics', ylabel=number_name)
+    ax.set_title('Total: {} {}'.format(int(total), number_name))
+    fig.savefig(f, format=fmt, dpi=dpi)
+
+
+def histogram(store, aggregates, fmt='png', dpi=100):
+    """ Summary: File name of the aggregates' bar chart in an ArtifactStore,
+        rendered only if that exact chart is not stored yet.
+        INPUT: ArtifactStore: where charts are kept.
+               dict: topics.topic_aggregates output plus 'number_name'.
+        OUTPUT: string: file name within the store.
+    """
+    if fmt not in FORMATS:
+        raise ValueError('Unknown chart format {!r}, use one of {}'.format(fmt, FORMATS))
+    spec = [aggregates['totals'], aggregates['total'], aggregates['number_name'], fmt, dpi]
+    key = hashlib.sha1(json.dumps(spec).encode('utf-8')).hexdigest()
+    name = '{}.{}'.format(key, fmt)
+    if store.touch(name):
+        return name
+    tmp = store.new_file('.' + fmt)
+    with open(tmp, 'wb') as f:
+        render_histogram(f, aggregates['totals'], aggregates['number_name'],
+                         aggregates['total'], fmt=fmt, dpi=dpi)
+    return store.add(tmp, '.' + fmt, key=key)
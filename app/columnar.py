@@ -0,0 +1,127 @@
+from __future__ import print_function
+import json
+import mmap
+import os
+import shutil
+import sys
+import numpy as np
+from cache import file_hash
+from ingest import TooManyRows, Upload
+
+# Column files of a dataset, in <name>.cols/ next to its csv:
+#   number.npy        float64 amounts
+#   text_offsets.npy  int64, text i is text.bin[offsets[i]:offsets[i+1]]
+#   text.bin          the texts' bytes, back to back
+#   meta.json         column names, row count, sha1 of the csv
+# All of them are memory mapped on load, nothing is parsed.
+#   python columnar.py data/NSF_plasma.csv [...]
+
+
+def cols_path(path):
+    return os.path.splitext(path)[0] + '.cols'
+
+
+def fresh(path):
+    """Whether path has a column copy at least as new as the csv."""
+    meta = os.path.join(cols_path(path), 'meta.json')
+    return os.path.exists(meta) and os.path.getmtime(meta) >= os.path.getmtime(path)
+
+
+def to_bytes(text):
+    return text if isinstance(text, bytes) else text.encode('latin-1')
+
+
+def write(out, numbers, texts, number_name, text_name, digest=None):
+    """ Summary: Store two columns as a <name>.cols directory.
+        INPUT: string: directory to write, replaced atomically.
+               sequence of floats, sequence of strings: the columns.
+               string, string: column names.
+               string: sha1 of the source file, for the result cache.
+    """
+    tmp = out + '.tmp'
+    if os.path.isdir(tmp):
+        shutil.rmtree(tmp)
+    os.makedirs(tmp)
+    np.save(os.path.join(tmp, 'number.npy'), np.asarray(numbers, dtype=np.float64))
+    offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+    with open(os.path.join(tmp, 'text.bin'), 'wb') as f:
+        for i, text in enumerate(texts):
+            text = to_bytes(text)
+            f.write(text)
+            offsets[i + 1] = offsets[i] + len(text)
+    np.save(os.path.join(tmp, 'text_offsets.npy'), offsets)
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump({'number_name': number_name, 'text_name': text_name,
+                   'rows': len(texts), 'sha1': digest}, f)
+    if os.path.isdir(out):
+        old = out + '.old'
+        os.rename(out, old)
+        os.rename(tmp, out)
+        shutil.rmtree(old)
+    else:
+        os.rename(tmp, out)
+
+
+def convert(path):
+    """Write the column copy of a two-column (amount, text) csv."""
+    upload = Upload(path)
+    numbers, texts = upload.columns()
+    write(cols_path(path), np.array(numbers, dtype=float), texts,
+          upload.number_name, upload.text_name, digest=upload.hexdigest())
+    return cols_path(path)
+
+
+class Dataset(object):
+    """ Summary: A dataset loaded from its column copy: numbers is a
+        read-only memory-mapped float array and texts are sliced out of
+        the mapped text blob, so loading costs no parsing and the pages
+        are shared between processes.
+
+        Same header names, hexdigest() and columns() as ingest.Upload.
+    """
+
+    def __init__(self, path, max_rows=None):
+        self.path = cols_path(path)
+        with open(os.path.join(self.path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        if max_rows is not None and self.meta['rows'] > max_rows:
+            raise TooManyRows('{} has more than {} rows'.format(path, max_rows))
+        self.number_name = self.meta['number_name']
+        self.text_name = self.meta['text_name']
+        self.numbers = np.load(os.path.join(self.path, 'number.npy'), mmap_mode='r')
+        self.offsets = np.load(os.path.join(self.path, 'text_offsets.npy'), mmap_mode='r')
+        self.blob = b''
+        if self.offsets[-1]:
+            with open(os.path.join(self.path, 'text.bin'), 'rb') as f:
+                self.blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return self.meta['rows']
+
+    def text(self, i):
+        text = self.blob[int(self.offsets[i]):int(self.offsets[i + 1])]
+        return text if str is bytes else text.decode('latin-1')
+
+    def columns(self):
+        """(numbers, texts): the amount array and the list of texts."""
+        bounds = self.offsets.tolist()
+        blob = self.blob
+        texts = [blob[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
+        if str is not bytes:
+            texts = [text.decode('latin-1') for text in texts]
+        return self.numbers, texts
+
+    def hexdigest(self):
+        return self.meta['sha1']
+
+
+def open_table(path, max_rows=None):
+    """The column copy of path when it is up to date, else an ingest.Upload."""
+    if fresh(path):
+        return Dataset(path, max_rows=max_rows)
+    return Upload(path, max_rows=max_rows)
+
+
+if __name__ == '__main__':
+    for path in sys.argv[1:]:
+        print('wrote', convert(path))
@@ -1,21 +1,102 @@
-import csv
+from __future__ import print_function
+import argparse
+import os
+import sys
+from multiprocessing import Pool
 import pandas as pd
 
-input_file = csv.DictReader(open("NSF_ZFull_journalism.csv"))
+# Turn NSF award search exports (NSF_ZFull_<name>.csv) into the two-column
+# files NLQ analyzes: amount in M$ and abstract (NSF_<name>.csv).
+#   python clean_data_nlq.py NSF_ZFull_journalism.csv [more exports ...] [-j 4]
+# Several exports are cleaned in parallel, one process each.
+#
+# Inside the app folder, also write the column copy the app memory-maps
+# instead of parsing the csv (see columnar.py). Standalone, only the csv.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+try:
+    import columnar
+except ImportError:
+    columnar = None
 
-text = [] 
-number = []
+AMOUNT = 'AwardedAmountToDate'
+TEXT = 'Abstract'
+ENCODING = 'latin-1'
 
-for row in input_file:
-    text.append(row["Abstract"])
-    number.append(row["AwardedAmountToDate"])
 
-number_cleaned=[]
-for amount in number: 
-    number_cleaned.append(float(
-            str(amount).replace("$", "").replace(",", "").replace(".00", "")
-                                )/1e6
-                          )
-df = pd.DataFrame({'M$':number_cleaned, 'NSF - Journalism':text})
+def parse_money(values):
+    """ Summary: Currency strings ('$1,234.50') to floats, on the whole
+        column at once. Cents are kept: '$100.005' is 100.005, not the
+        1005 that stripping '.00' used to give. Unreadable amounts are NaN.
+        INPUT: pandas Series of (unicode) strings.
+        OUTPUT: pandas Series of floats, same index.
+    """
+    numbers = values.str.replace('$', '', regex=False).str.replace(',', '', regex=False)
+    return pd.to_numeric(numbers.str.strip(), errors='coerce')
 
-df.to_csv('NSF_journalism.csv', index = False)
\ No newline at end of file
+
+def default_names(src):
+    """Output path and amount/text column titles for an NSF_ZFull_ export."""
+    folder, base = os.path.split(src)
+    name = os.path.splitext(base)[0]
+    if name.startswith('NSF_ZFull_'):
+        name = name[len('NSF_ZFull_'):]
+    title = name.replace('_', ' ')
+    return (os.path.join(folder, 'NSF_{}.csv'.format(name)),
+            'NSF - {}'.format(title[:1].upper() + title[1:]))
+
+
+def clean_export(src, dst=None, title=None, scale=1e6):
+    """ Summary: Write the cleaned two-column file for one export.
+        INPUT: string: path of the NSF export.
+               string: output path, NSF_<name>.csv next to it by default.
+               string: title of the text column, 'NSF - <Name>' by default.
+               float: amounts are divided by this (1e6: M$).
+        OUTPUT: (string, int, int): output path, rows written, rows dropped
+                because their amount could not be read.
+    """
+    default_dst, default_title = default_names(src)
+    dst = dst or default_dst
+    title = title or default_title
+    df = pd.read_csv(src, usecols=[AMOUNT, TEXT], dtype=str, encoding=ENCODING,
+                     keep_default_na=False)
+    number = parse_money(df[AMOUNT]) / scale
+    keep = number.notnull()
+    out = pd.DataFrame({'M$': number[keep], title: df[TEXT][keep]},
+                       columns=['M$', title])
+    out.to_csv(dst, index=False, encoding=ENCODING)
+    if columnar is not None:
+        columnar.write(columnar.cols_path(dst), out['M$'].values, out[title].tolist(),
+                       'M$', title, digest=columnar.file_hash(dst))
+    return dst, int(keep.sum()), int(len(keep) - keep.sum())
+
+
+def _clean(args):
+    return clean_export(*args)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Clean NSF award exports for NLQ.')
+    parser.add_argument('exports', nargs='+', help='NSF_ZFull_*.csv files')
+    parser.add_argument('-o', '--output', help='output path (one export only)')
+    parser.add_argument('-t', '--title', help='text column title (one export only)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='parallel processes (default: one per CPU)')
+    args = parser.parse_args(argv)
+    if len(args.exports) > 1 and (args.output or args.title):
+        parser.error('--output and --title need a single export')
+    tasks = [(src, args.output, args.title) for src in args.exports]
+    if len(tasks) == 1 or args.jobs == 1:
+        results = [_clean(task) for task in tasks]
+    else:
+        pool = Pool(args.jobs)
+        try:
+            results = pool.map(_clean, tasks)
+        finally:
+            pool.close()
+    for (dst, rows, dropped), src in zip(results, args.exports):
+        print('{} -> {}: {} rows'.format(src, dst, rows) +
+              (', {} dropped (no amount)'.format(dropped) if dropped else ''))
+
+
+if __name__ == '__main__':
+    main()
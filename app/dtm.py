@@ -0,0 +1,62 @@
+from __future__ import print_function
+import re
+from array import array
+import numpy as np
+import scipy.sparse as sp
+
+
+# Same rule as textmining.simple_tokenize: lowercase letters only
+NON_ALPHA = re.compile('[^a-z]')
+
+
+def simple_tokenize(document):
+    """Lowercase a document and split it on everything that is not a letter."""
+    return NON_ALPHA.sub(' ', document.lower()).split()
+
+
+def build_dtm(docs, tokenizer=simple_tokenize, vocabulary=None, grow=False):
+    """ Summary: Build a sparse document-term count matrix in one pass.
+        INPUT: iterable of strings: documents, consumed once.
+               function: tokenizer turning a document into a list of words,
+               None if the documents are already lists of tokens.
+               dict: word -> column map, e.g. of a fitted model. Words
+               outside it are skipped, or added to it in place with
+               grow=True. By default the vocabulary is built from the
+               documents.
+        OUTPUT: scipy.sparse CSR matrix (docs x vocab) of int counts,
+                list of vocabulary words in column order.
+
+        Replaces textmining.TermDocumentMatrix + np.array(rows(cutoff=1)),
+        which materialized the full dense docs x vocab matrix. Columns are
+        numbered in order of first appearance.
+    """
+    fixed = vocabulary is not None and not grow
+    if vocabulary is None:
+        vocabulary = {}
+    indices = array('i')
+    data = array('i')
+    indptr = array('i', [0])
+
+    for doc in docs:
+        counts = {}
+        for word in (doc if tokenizer is None else tokenizer(doc)):
+            j = vocabulary.get(word)
+            if j is None:
+                if fixed:
+                    continue
+                j = vocabulary[word] = len(vocabulary)
+            counts[j] = counts.get(j, 0) + 1
+        indices.extend(counts.keys())
+        data.extend(counts.values())
+        indptr.append(len(indices))
+
+    vocab = [None] * len(vocabulary)
+    for word, j in vocabulary.items():
+        vocab[j] = word
+
+    X = sp.csr_matrix((np.asarray(data, dtype=np.intc),
+                       np.asarray(indices, dtype=np.intc),
+                       np.asarray(indptr, dtype=np.intc)),
+                      shape=(len(indptr) - 1, len(vocab)))
+    X.sort_indices()
+    return X, vocab
@@ -0,0 +1,130 @@
+from __future__ import print_function
+import numpy as np
+import lda
+from joblib import parallel_backend
+
+# 'gibbs': lda.LDA, single-threaded collapsed Gibbs sampler (the original one)
+# 'vb': scikit-learn variational Bayes, E-step spread over n_jobs processes
+ENGINES = ('gibbs', 'vb')
+
+
+class VBLDA(object):
+    """ Summary: Variational Bayes LDA with the lda.LDA interface
+        (fit, topic_word_, doc_topic_), so clem_lda can swap engines.
+
+        The E-step over document batches runs in n_jobs processes. Variational
+        Bayes converges in far fewer passes than the Gibbs sampler needs
+        iterations, so n_iter is capped at max_passes.
+
+        The processes come from joblib's multiprocessing backend, which
+        ends them with the fit: loky's would stay around idle and keep a
+        JobQueue worker (jobs.Worker, not daemonic so it may start them)
+        from exiting.
+    """
+
+    def __init__(self, n_topics, n_iter=500, random_state=None, n_jobs=-1,
+                 max_passes=30, learning_method='batch'):
+        self.n_topics = n_topics
+        self.n_iter = min(n_iter, max_passes)
+        self.random_state = random_state
+        self.n_jobs = n_jobs
+        self.learning_method = learning_method
+
+    def fit(self, X):
+        from sklearn.decomposition import LatentDirichletAllocation
+        self.model = LatentDirichletAllocation(
+            n_components=self.n_topics, max_iter=self.n_iter,
+            learning_method=self.learning_method, n_jobs=self.n_jobs,
+            random_state=self.random_state)
+        with parallel_backend('multiprocessing'):
+            doc_topic = self.model.fit_transform(X)
+        self.doc_topic_ = doc_topic / doc_topic.sum(axis=1)[:, np.newaxis]
+        components = self.model.components_
+        self.topic_word_ = components / components.sum(axis=1)[:, np.newaxis]
+        self.components_ = self.topic_word_
+        # topic-word counts and prior, as lda.LDA.nzw_ and eta
+        self.eta = self.model.topic_word_prior_
+        self.nzw_ = np.maximum(components - self.eta, 0)
+        return self
+
+
+class StagedGibbs(object):
+    """ Summary: lda.LDA fitted a few sweeps at a time, so a model selection
+        can look at the topics between stages and drop the model early.
+        After n sweeps in total the model equals lda.LDA(n_iter=n).fit(X)
+        with the same random_state.
+
+        Drives lda.LDA's own _initialize and _sample_topics, the steps its
+        fit() loops over.
+    """
+
+    max_iter = None
+
+    def __init__(self, n_topics, random_state=2):
+        self.model = lda.LDA(n_topics, n_iter=1, random_state=random_state)
+        self.iterations = 0
+
+    def fit_more(self, X, n_iter):
+        m = self.model
+        if not self.iterations:
+            m._initialize(X)
+            self.random = lda.utils.check_random_state(m.random_state)
+            self.rands = m._rands.copy()
+        for it in range(n_iter):
+            self.random.shuffle(self.rands)
+            m._sample_topics(self.rands)
+        self.iterations += n_iter
+        return self
+
+    @property
+    def topic_word_(self):
+        counts = (self.model.nzw_ + self.model.eta).astype(float)
+        return counts / counts.sum(axis=1)[:, np.newaxis]
+
+
+class StagedVB(object):
+    """ Summary: Online variational Bayes fitted a few passes at a time
+        (scikit-learn partial_fit over all documents), for the same use as
+        StagedGibbs. Passes are capped at max_passes like VBLDA.
+    """
+
+    def __init__(self, n_topics, random_state=2, max_passes=30):
+        self.n_topics = n_topics
+        self.random_state = random_state
+        self.max_iter = max_passes
+        self.model = None
+        self.iterations = 0
+
+    def fit_more(self, X, n_iter):
+        from sklearn.decomposition import LatentDirichletAllocation
+        if self.model is None:
+            self.model = LatentDirichletAllocation(
+                n_components=self.n_topics, learning_method='online',
+                total_samples=X.shape[0], random_state=self.random_state)
+        for it in range(min(n_iter, self.max_iter - self.iterations)):
+            self.model.partial_fit(X)
+            self.iterations += 1
+        return self
+
+    @property
+    def topic_word_(self):
+        components = self.model.components_
+        return components / components.sum(axis=1)[:, np.newaxis]
+
+
+def make_model(engine, n_topics, n_iter=500, random_state=2):
+    """Return an unfitted LDA model for one of ENGINES."""
+    if engine == 'gibbs':
+        return lda.LDA(n_topics, n_iter=n_iter, random_state=random_state)
+    if engine == 'vb':
+        return VBLDA(n_topics, n_iter=n_iter, random_state=random_state)
+    raise ValueError('Unknown LDA engine {!r}, use one of {}'.format(engine, ENGINES))
+
+
+def make_staged(engine, n_topics, random_state=2):
+    """Return an unfitted staged model (fit_more, topic_word_) for one of ENGINES."""
+    if engine == 'gibbs':
+        return StagedGibbs(n_topics, random_state=random_state)
+    if engine == 'vb':
+        return StagedVB(n_topics, random_state=random_state)
+    raise ValueError('Unknown LDA engine {!r}, use one of {}'.format(engine, ENGINES))
@@ -0,0 +1,127 @@
+from __future__ import print_function
+import gzip
+import hashlib
+import mmap
+import os
+import shutil
+from flask import abort, current_app, request, render_template, make_response, send_file
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Pre-compressed variants, preferred in this order when the client takes them
+ENCODINGS = [('gzip', '.gz')]
+if brotli is not None:
+    ENCODINGS.insert(0, ('br', '.br'))
+
+
+class TemplateCache(object):
+    """ Summary: Pages rendered from templates that take no context, kept in
+        memory with a strong ETag and re-rendered when the template file
+        changes on disk (one stat per request).
+    """
+
+    def __init__(self):
+        self.pages = {}
+
+    def response(self, template):
+        """Response for a template page, 304 if the client has it already."""
+        path = os.path.join(current_app.root_path, current_app.template_folder, template)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            abort(404)
+        page = self.pages.get(template)
+        if page is None or page[0] != mtime:
+            body = render_template(template)
+            etag = hashlib.sha1(body.encode('utf-8')).hexdigest()
+            page = self.pages[template] = (mtime, body, etag)
+        mtime, body, etag = page
+        rv = make_response(body)
+        rv.set_etag(etag)
+        rv.last_modified = mtime
+        return rv.make_conditional(request)
+
+
+def is_fresh(variant, path):
+    return os.path.exists(variant) and os.path.getmtime(variant) >= os.path.getmtime(path)
+
+
+def precompress(path):
+    """Write path.gz (and path.br when brotli is installed) if missing or stale."""
+    for encoding, ext in ENCODINGS:
+        variant = path + ext
+        if is_fresh(variant, path):
+            continue
+        tmp = variant + '.tmp'
+        with open(path, 'rb') as src:
+            if encoding == 'gzip':
+                with gzip.open(tmp, 'wb', 9) as dst:
+                    shutil.copyfileobj(src, dst)
+            else:
+                with open(tmp, 'wb') as dst:
+                    dst.write(brotli.compress(src.read()))
+        os.rename(tmp, variant)
+
+
+def send_precompressed(path, mimetype, **kwargs):
+    """ Summary: send_file for a file with pre-compressed variants: picks the
+        best variant the client accepts, with Content-Encoding and Vary set,
+        and answers Range requests so interrupted downloads can resume.
+        ETag, Last-Modified and 304s come from send_file(conditional=True).
+    """
+    for encoding, ext in ENCODINGS:
+        if encoding in request.accept_encodings and is_fresh(path + ext, path):
+            path = path + ext
+            rv = send_file(path, mimetype=mimetype, conditional=True, **kwargs)
+            rv.headers['Content-Encoding'] = encoding
+            break
+    else:
+        rv = send_file(path, mimetype=mimetype, conditional=True, **kwargs)
+    rv.headers['Vary'] = 'Accept-Encoding'
+    rv.headers['Accept-Ranges'] = 'bytes'
+    # recent Werkzeug answers ranges itself, anything older sends a 200
+    if rv.status_code == 200 and request.range is not None:
+        rv = ranged(rv, path)
+    return rv
+
+
+def mmap_chunks(path, start, stop, chunk_size=1 << 16):
+    """Bytes start:stop of a file, read through a read-only mmap."""
+    with open(path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for i in range(start, stop, chunk_size):
+                yield mm[i:min(i + chunk_size, stop)]
+        finally:
+            mm.close()
+
+
+def ranged(rv, path):
+    """ Summary: Turn a full 200 response for path into the 206 answer to the
+        request's Range header (single ranges), or a 416 if it does not fit.
+        Multiple ranges and a stale If-Range get the full file.
+    """
+    if_range = request.headers.get('If-Range')
+    if if_range and if_range not in (rv.headers.get('ETag'), rv.headers.get('Last-Modified')):
+        return rv
+    size = os.path.getsize(path)
+    byte_range = request.range.range_for_length(size)
+    if byte_range is None and len(request.range.ranges) > 1:
+        return rv
+    if hasattr(rv.response, 'close'):
+        rv.response.close()
+    if byte_range is None:
+        rv.response = []
+        rv.status_code = 416
+        rv.headers['Content-Range'] = 'bytes */{}'.format(size)
+        rv.headers['Content-Length'] = '0'
+        return rv
+    start, stop = byte_range
+    rv.response = mmap_chunks(path, start, stop)
+    rv.status_code = 206
+    rv.headers['Content-Range'] = 'bytes {}-{}/{}'.format(start, stop - 1, size)
+    rv.headers['Content-Length'] = str(stop - start)
+    return rv
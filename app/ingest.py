@@ -0,0 +1,323 @@
+from __future__ import print_function
+import csv
+import fcntl
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+
+
+class TooManyRows(Exception):
+    """Raised as soon as an upload goes past the row limit."""
+    pass
+
+
+class BadUpload(ValueError):
+    """Raised for an upload that is not a usable CSV, or not this upload."""
+    pass
+
+
+class HashingReader(object):
+    """Line iterator over a file that feeds every line into a sha1."""
+
+    def __init__(self, f):
+        self.f = f
+        self.sha1 = hashlib.sha1()
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        line = next(self.f)
+        self.sha1.update(line)
+        # csv on Python 3 wants text, latin-1 maps every byte back unchanged
+        return line if str is bytes else line.decode('latin-1')
+    __next__ = next
+
+    def hexdigest(self):
+        return self.sha1.hexdigest()
+
+
+class Upload(object):
+    """ Summary: Single streaming pass over an uploaded two-column CSV
+        (amount, text).
+
+        The header gives the column names, rows() yields (number, text)
+        pairs and stops with TooManyRows past max_rows, so an oversized
+        file is never read to the end. The content hash is computed on
+        the way, hexdigest() is complete once rows() is exhausted.
+    """
+
+    def __init__(self, path, max_rows=None):
+        self.path = path
+        self.max_rows = max_rows
+        self.f = open(path, 'rb')
+        self.lines = HashingReader(self.f)
+        self.reader = csv.reader(self.lines)
+        header = next(self.reader)
+        self.number_name = header[0]
+        self.text_name = header[1]
+
+    def rows(self):
+        n = 0
+        try:
+            for row in self.reader:
+                if not row:
+                    continue
+                n += 1
+                if self.max_rows is not None and n > self.max_rows:
+                    raise TooManyRows('{} has more than {} rows'.format(
+                        self.path, self.max_rows))
+                yield row[0], row[1]
+        finally:
+            self.f.close()
+
+    def columns(self):
+        """(numbers, texts) as two lists, reading all rows."""
+        number = []
+        text = []
+        for n, t in self.rows():
+            number.append(n)
+            text.append(t)
+        return number, text
+
+    def hexdigest(self):
+        return self.lines.hexdigest()
+
+
+class RowCounter(object):
+    """ Summary: Counts CSV records in bytes fed chunk by chunk, without
+        holding the file. Quoting follows csv.reader: a quote only opens a
+        quoted field at the start of a field, "" inside one is a literal
+        quote, and newlines inside quoted fields do not end a record.
+        Blank lines are not records. The first record is parsed as the
+        header once it is complete.
+    """
+
+    # where the last byte fed left the parser
+    START, FIELD, QUOTED, QUOTE = range(4)
+    FIELD_END = re.compile(b'[,\n]')
+
+    def __init__(self, state=None):
+        state = state or {}
+        self.records = state.get('records', 0)
+        self.open = state.get('open', False)
+        self.at = state.get('at', self.FIELD if self.open else self.START)
+        self.columns = state.get('columns')
+        self.head = state.get('head', '').encode('latin-1')
+
+    def state(self):
+        return {'records': self.records, 'at': self.at,
+                'open': self.open, 'columns': self.columns,
+                'head': self.head.decode('latin-1')}
+
+    def feed(self, chunk):
+        if self.columns is None:
+            self.head += chunk
+        at, i, n = self.at, 0, len(chunk)
+        while i < n:
+            if at == self.QUOTED:
+                j = chunk.find(b'"', i)
+                if j < 0:
+                    break
+                at, i = self.QUOTE, j + 1
+                continue
+            if at != self.FIELD and chunk[i:i + 1] == b'"':
+                # opens a field, or is the second quote of a "" in one
+                at, i = self.QUOTED, i + 1
+                self.open = True
+                continue
+            # unquoted text, or what follows a closing quote, up to , or \n
+            m = self.FIELD_END.search(chunk, i)
+            j = m.start() if m else n
+            if chunk[i:j].strip(b'\r'):
+                self.open = True
+            if m is None:
+                at = self.FIELD
+                break
+            if chunk[j:j + 1] == b',':
+                self.open = True
+            else:
+                if self.open:
+                    self.records += 1
+                self.open = False
+            at, i = self.START, j + 1
+        self.at = at
+        if self.columns is None and self.records:
+            self.parse_header()
+
+    def parse_header(self):
+        head = self.head if str is bytes else self.head.decode('latin-1')
+        self.columns = next(csv.reader(head.splitlines(True)), [])
+        self.head = b''
+
+    def end(self):
+        """Count a last record that has no newline after it."""
+        if self.open:
+            self.records += 1
+            self.open = False
+        if self.columns is None and self.records:
+            self.parse_header()
+
+    def rows(self):
+        """Data rows so far, including a last one without a newline."""
+        return max(self.records + (1 if self.open else 0) - 1, 0)
+
+
+class ResumableUploads(object):
+    """ Summary: CSV uploads received in chunks under root/.partial, so a
+        large file is streamed to disk and an interrupted upload continues
+        from the last byte the server has.
+
+        Rows are counted and the header checked as the bytes arrive, and
+        an upload is dropped as soon as it passes max_rows or max_bytes,
+        instead of after a full parse in /predict. finish() renames the
+        complete file into root, so a half-written file is never seen
+        there. Partial uploads untouched for max_age seconds are removed.
+    """
+
+    def __init__(self, root='uploads', max_rows=None, max_bytes=None,
+                 max_age=24 * 3600):
+        self.root = root
+        self.partial = os.path.join(root, '.partial')
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        if not os.path.isdir(self.partial):
+            os.makedirs(self.partial)
+
+    def _path(self, upload_id, ext):
+        if not upload_id.isalnum():
+            raise KeyError(upload_id)
+        return os.path.join(self.partial, upload_id + ext)
+
+    def _read(self, upload_id):
+        try:
+            with open(self._path(upload_id, '.json')) as f:
+                return json.load(f)
+        except IOError:
+            raise KeyError(upload_id)
+
+    def _open(self, upload_id, mode):
+        """The partial file, locked, KeyError if there is no such upload."""
+        try:
+            f = open(self._path(upload_id, '.part'), mode)
+        except IOError:
+            raise KeyError(upload_id)
+        fcntl.flock(f, fcntl.LOCK_EX)
+        return f
+
+    def _write(self, upload_id, state):
+        tmp = self._path(upload_id, '.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+        os.rename(tmp, self._path(upload_id, '.json'))
+
+    def __contains__(self, upload_id):
+        try:
+            return os.path.exists(self._path(upload_id, '.json'))
+        except KeyError:
+            return False
+
+    def start(self, filename):
+        """Open an upload that will become root/filename, return its id."""
+        self.clean()
+        upload_id = uuid.uuid4().hex
+        open(self._path(upload_id, '.part'), 'wb').close()
+        self._write(upload_id, {'filename': filename, 'offset': 0,
+                                'counter': RowCounter().state()})
+        return upload_id
+
+    def status(self, upload_id):
+        """Filename, bytes received (where to resume) and rows so far."""
+        state = self._read(upload_id)
+        return {'upload_id': upload_id, 'filename': state['filename'],
+                'offset': state['offset'],
+                'rows': RowCounter(state['counter']).rows()}
+
+    def append(self, upload_id, offset, stream, chunk_size=1 << 16):
+        """ Summary: Write the bytes of a file-like object at offset.
+            INPUT: string: upload id from start().
+                   int: where the bytes go, must be the current offset.
+                   file-like: the chunk, read in chunk_size pieces.
+            OUTPUT: dict: status() after the chunk.
+
+            Raises BadUpload on a wrong offset or header, TooManyRows past
+            max_rows or max_bytes (the upload is then removed). Only whole
+            chunks count: bytes of a chunk that fails halfway are cut off
+            again, and the client resumes from the returned offset.
+        """
+        with self._open(upload_id, 'r+b') as f:
+            state = self._read(upload_id)
+            if offset != state['offset']:
+                raise BadUpload('upload {} is at byte {}, not {}'.format(
+                    upload_id, state['offset'], offset))
+            counter = RowCounter(state['counter'])
+            f.seek(offset)
+            try:
+                for chunk in iter(lambda: stream.read(chunk_size), b''):
+                    offset += len(chunk)
+                    if self.max_bytes is not None and offset > self.max_bytes:
+                        raise TooManyRows('upload is larger than {} bytes'.format(
+                            self.max_bytes))
+                    counter.feed(chunk)
+                    self._check(counter)
+                    f.write(chunk)
+            except (TooManyRows, BadUpload):
+                self.discard(upload_id)
+                raise
+            except Exception:
+                f.truncate(state['offset'])
+                raise
+            state['offset'] = offset
+            state['counter'] = counter.state()
+            self._write(upload_id, state)
+        return self.status(upload_id)
+
+    def _check(self, counter):
+        if counter.columns is not None and len(counter.columns) < 2:
+            raise BadUpload('the first line should name two columns, an amount and a text')
+        if self.max_rows is not None and counter.rows() > self.max_rows:
+            raise TooManyRows('upload has more than {} rows'.format(self.max_rows))
+
+    def finish(self, upload_id):
+        """Move the complete upload into root, return its path there."""
+        with self._open(upload_id, 'rb') as f:
+            state = self._read(upload_id)
+            counter = RowCounter(state['counter'])
+            counter.end()
+            if not counter.records:
+                raise BadUpload('upload {} is empty'.format(upload_id))
+            self._check(counter)
+            path = os.path.join(self.root, state['filename'])
+            os.rename(self._path(upload_id, '.part'), path)
+            os.remove(self._path(upload_id, '.json'))
+        return path
+
+    def save(self, filename, stream):
+        """Receive a whole file in one go, return its path in root."""
+        upload_id = self.start(filename)
+        self.append(upload_id, 0, stream)
+        return self.finish(upload_id)
+
+    def discard(self, upload_id):
+        for ext in ('.part', '.json'):
+            try:
+                os.remove(self._path(upload_id, ext))
+            except OSError:
+                pass
+
+    def clean(self):
+        """Remove partial uploads nobody wrote to for max_age seconds."""
+        now = time.time()
+        for name in os.listdir(self.partial):
+            upload_id, ext = os.path.splitext(name)
+            if ext != '.part':
+                continue
+            try:
+                if now - os.path.getmtime(os.path.join(self.partial, name)) > self.max_age:
+                    self.discard(upload_id)
+            except OSError:
+                pass
@@ -0,0 +1,99 @@
+from __future__ import print_function
+import multiprocessing
+import threading
+import uuid
+from collections import OrderedDict
+from multiprocessing.pool import Pool
+
+
+class QueueFull(Exception):
+    """Raised when too many jobs are already waiting for a worker."""
+    pass
+
+
+class Worker(multiprocessing.Process):
+    """ Summary: Pool process that is never daemonic, so a job can start
+        processes of its own: joblib's for the 'vb' engine and the topic
+        count sweep's pool would otherwise fall back to a single process.
+        The pool still terminates its workers when it is closed or at exit.
+    """
+
+    @property
+    def daemon(self):
+        return False
+
+    @daemon.setter
+    def daemon(self, value):
+        pass
+
+
+if str is bytes:
+    class WorkerPool(Pool):
+        Process = Worker
+else:
+    class WorkerContext(type(multiprocessing.get_context())):
+        Process = Worker
+
+    class WorkerPool(Pool):
+        def __init__(self, processes=None):
+            Pool.__init__(self, processes, context=WorkerContext())
+
+
+class JobQueue(object):
+    """ Summary: Run a slow function (clem_lda) in a bounded pool of worker
+        processes so the Flask request thread returns right away.
+
+        submit() hands back a job id, status() and result() look it up later.
+        At most max_pending jobs may wait or run at once, and only the
+        max_jobs most recent jobs are remembered. The workers are started
+        by the first submit(), so a process that imports the app but never
+        serves it (the debug reloader's watcher) does not fork them.
+    """
+
+    def __init__(self, func, processes=None, max_pending=16, max_jobs=256):
+        self.func = func
+        self.processes = processes
+        self.pool = None
+        self.max_pending = max_pending
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def pending(self):
+        return sum(1 for r in self.jobs.values() if not r.ready())
+
+    def submit(self, *args, **kwargs):
+        """Queue func(*args, **kwargs) and return its job id."""
+        with self.lock:
+            if self.pending() >= self.max_pending:
+                raise QueueFull('{} jobs already queued'.format(self.max_pending))
+            if self.pool is None:
+                self.pool = WorkerPool(self.processes)
+            job_id = uuid.uuid4().hex
+            self.jobs[job_id] = self.pool.apply_async(self.func, args, kwargs)
+            # forget the oldest finished jobs
+            for old_id in list(self.jobs):
+                if len(self.jobs) <= self.max_jobs:
+                    break
+                if self.jobs[old_id].ready():
+                    del self.jobs[old_id]
+        return job_id
+
+    def status(self, job_id):
+        """One of 'unknown', 'pending', 'failed' or 'done'."""
+        r = self.jobs.get(job_id)
+        if r is None:
+            return 'unknown'
+        if not r.ready():
+            return 'pending'
+        return 'done' if r.successful() else 'failed'
+
+    def result(self, job_id):
+        """Return value of a finished job, re-raises the worker exception."""
+        return self.jobs[job_id].get()
+
+    def close(self):
+        if self.pool is None:
+            return
+        self.pool.close()
+        self.pool.join()
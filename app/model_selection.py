@@ -0,0 +1,115 @@
+from __future__ import print_function
+import multiprocessing
+import numpy as np
+import scipy.sparse as sp
+from engines import make_staged
+from registry import fold_in
+from topics import umass_coherence
+
+# Held-out data of the sweep, set once per worker process by _init
+_data = {}
+
+
+def heldout_split(X, frac=0.2, random_state=2):
+    """ Summary: Split a document-term matrix for held-out evaluation.
+        INPUT: scipy.sparse matrix: document-term counts.
+               float: share of documents held out.
+        OUTPUT: (train, observed, unseen): CSR matrices. The held-out
+                documents' counts are split in two halves, observed is
+                folded in to get their topic mixtures and unseen is scored
+                (document completion, Wallach et al. 2009).
+    """
+    rng = np.random.RandomState(random_state)
+    X = sp.csr_matrix(X)
+    held = rng.rand(X.shape[0]) < frac
+    train = X[~held]
+    test = X[held].tocoo()
+    half = rng.binomial(test.data, 0.5)
+    observed = sp.csr_matrix((half, (test.row, test.col)), shape=test.shape)
+    unseen = sp.csr_matrix((test.data - half, (test.row, test.col)), shape=test.shape)
+    observed.eliminate_zeros()
+    unseen.eliminate_zeros()
+    return train, observed, unseen
+
+
+def perplexity(topic_word, observed, unseen, n_iter=20, alpha=0.1):
+    """Perplexity of the unseen tokens, mixtures folded in from observed."""
+    theta = fold_in(observed.tocoo(), topic_word, n_iter, alpha)
+    unseen = unseen.tocoo()
+    p = (theta[unseen.row] * topic_word[:, unseen.col].T).sum(axis=1)
+    return float(np.exp(-np.sum(unseen.data * np.log(p)) / unseen.data.sum()))
+
+
+def _init(train, observed, unseen):
+    _data.update(train=train, observed=observed, unseen=unseen)
+
+
+def _stage(args):
+    """Fit one configuration n_iter more steps and score it, in a worker."""
+    model, n_iter = args
+    model.fit_more(_data['train'], n_iter)
+    topic_word = model.topic_word_
+    return (model, perplexity(topic_word, _data['observed'], _data['unseen']),
+            float(umass_coherence(_data['train'], topic_word).mean()))
+
+
+def sweep(X, topic_counts, engine='gibbs', n_iter=500, stages=3, keep=0.5,
+          heldout=0.2, tolerance=0.01, processes=None, random_state=2):
+    """ Summary: Pick the number of topics from the data.
+        INPUT: scipy.sparse matrix: document-term counts.
+               list of ints: topic counts to try.
+               string: one of engines.ENGINES.
+               int: iterations of a full fit.
+               int: number of stages, keep: share of configurations kept
+               after each one.
+               float: share of documents held out for perplexity.
+               float: the smallest count within this relative distance of
+               the lowest perplexity wins, as perplexity tends to keep
+               improving a little with more topics.
+               int: worker processes, by default one per CPU.
+        OUTPUT: dict: 'best' topic count and 'curve', one entry per count
+                with its held-out perplexity, mean UMass coherence, the
+                iterations it got and whether it was stopped early.
+
+        Successive halving: every count is fitted for the first stage, the
+        ones with the worst held-out perplexity are dropped, and the rest
+        go on from where they are (models continue, nothing is refitted).
+        Stage lengths double and add up to n_iter, so only the best counts
+        get a full fit. The stages of all counts run in parallel.
+    """
+    train, observed, unseen = heldout_split(X, heldout, random_state)
+    models = dict((k, make_staged(engine, k, random_state)) for k in topic_counts)
+    max_iter = list(models.values())[0].max_iter
+    n_iter = min(n_iter, max_iter or n_iter)
+    lengths = [n_iter * 2**i // (2**stages - 1) for i in range(stages)]
+    lengths[-1] = n_iter - sum(lengths[:-1])
+
+    # daemonic processes cannot start their own pool (JobQueue workers can)
+    if processes == 1 or multiprocessing.current_process().daemon:
+        _init(train, observed, unseen)
+        pool_map = map
+        pool = None
+    else:
+        pool = multiprocessing.Pool(processes, _init, (train, observed, unseen))
+        pool_map = pool.map
+
+    curve = {}
+    running = list(topic_counts)
+    try:
+        for stage, length in enumerate(lengths):
+            results = list(pool_map(_stage, [(models[k], length) for k in running]))
+            for k, (model, score, coherence) in zip(running, results):
+                models[k] = model
+                curve[k] = {'n_topics': k, 'perplexity': score, 'coherence': coherence,
+                            'iterations': model.iterations, 'stopped': True}
+            if stage < len(lengths) - 1:
+                running.sort(key=lambda k: curve[k]['perplexity'])
+                running = running[:max(1, int(np.ceil(len(running) * keep)))]
+    finally:
+        if pool is not None:
+            pool.close()
+    for k in running:
+        curve[k]['stopped'] = False
+    lowest = min(curve[k]['perplexity'] for k in running)
+    best = min(k for k in running if curve[k]['perplexity'] <= lowest * (1 + tolerance))
+    return {'best': best, 'curve': [curve[k] for k in sorted(curve)]}
@@ -3,92 +3,125 @@ import pandas as pd
 from nltk.stem.porter import PorterStemmer
 from nltk.corpus import stopwords
 from nltk.tokenize import word_tokenize
-import matplotlib.pyplot as plt
 import csv
 import numpy as np
 import pandas as pd
-import seaborn as sns
-import textmining
-import lda
-import textmining
 import nltk.corpus
 import os
+from vocab import TokenCache
+from cache import ResultCache
+from artifacts import ArtifactStore
+from engines import make_model
+from normalize import Normalizer
+from columnar import open_table
+from topics import topic_aggregates, topic_labels, ranked_topics
+from registry import ModelRegistry
+from model_selection import sweep
+import charts
 
 
 
 
 
 
-def clem_lda(a):
+STOP = set(stopwords.words('english'))
+STOP |= {'new', 'made', 'use'}
 
-	prev_num = 0
-	for f in os.listdir('static'):
-		if f[0:4] == 'hist':
-			num = int(f.split('_')[-1].split('.')[0])
-			if num > prev_num:
-				prev_num = num
-	f_name = 'hist_{}.png'.format(prev_num+1)
-	#t_name ='topic_table_{}.csv'.format(prev_num+1)
+# HTML stripping, stopwords and plural stripping over a whole column at once
+normalizer = Normalizer(STOP)
 
-	with open(a) as f:
-		Header = f.next().split(',')
-	number_name = Header[0]
-	text_name = Header[1][:-1]
+# Results keyed on file content + parameters, random_state makes them deterministic
+result_cache = ResultCache('cache')
 
-	#Read the input file
-	input_file = csv.DictReader(open(a))
+# Normalized corpora as int32 ids, over one vocabulary shared by the bundled
+# datasets in data/; uploads keep a vocabulary of their own (see vocab.py)
+token_cache = TokenCache('tokens')
+DATASETS = os.path.abspath('data')
 
-	text = []
-	number = []
+# Topic-count sweeps (n_topics='auto'), keyed like the results
+sweep_cache = ResultCache('cache/sweeps')
+TOPIC_COUNTS = (5, 10, 15, 20, 25, 30, 40, 50)
 
-	for row in input_file:
-	    number.append(row[number_name])
-	    text.append(row[text_name])
+# Histograms, named after the plotted numbers and served from static/plots,
+# their index and unfinished files kept out of it in cache/plots
+plot_store = ArtifactStore('static/plots', work='cache/plots')
+
+# Fitted models saved by name for /infer, see build_models.py
+model_registry = ModelRegistry('models')
 
-	d = len(text)
-	n_topics = 25
 
-	text_stop = []
-	stop = set(stopwords.words('english'))
-	stop |= {'new', 'made', 'use'}
+def select_topics(digest, X, engine='gibbs', n_iter=500, topic_counts=TOPIC_COUNTS):
+	"""Best topic count of a corpus and the sweep curve, cached per corpus."""
+	key = sweep_cache.key(digest, topic_counts=list(topic_counts), engine=engine,
+	                      n_iter=n_iter, normalizer=normalizer.config())
+	hit = sweep_cache.get(key)
+	if hit is not None:
+		return hit['best'], hit['curve']
+	result = sweep(X, topic_counts, engine=engine, n_iter=n_iter)
+	sweep_cache.put(key, {}, **result)
+	return result['best'], result['curve']
 
-	for i in range(len(text)):
-	    sentence = text[i].lower()
-	    A = [i for i in sentence.replace('<br/>',' ').split() if i not in stop]
-	    A = [i[:-1] for i in A  if i[-1] == 's']
-	    text_stop.append(' '.join(A))
 
-	tdm = textmining.TermDocumentMatrix()
+def clem_lda(a, n_topics=25, n_iter=500, n_top_words=8, engine='gibbs',
+             max_rows=None, model_name=None, chart_format='png', relevance=1.0):
 
-	for i in range(d):
-	    tdm.add_doc(text_stop[i])
+	# one pass over the file: header, rows and content hash, or the
+	# memory-mapped column copy if there is one (columnar.py),
+	# ingest.TooManyRows past max_rows
+	upload = open_table(a, max_rows=max_rows)
+	number_name = upload.number_name
+	text_name = upload.text_name
+	number, text = upload.columns()
 
-	# # create a temp variable with doc-term info
-	temp = list(tdm.rows(cutoff=1))
+	key = result_cache.key(upload.hexdigest(), n_topics=n_topics, n_iter=n_iter,
+	                       engine=engine, n_top_words=n_top_words, chart_format=chart_format,
+	                       relevance=relevance,
+	                       normalizer=normalizer.config())
+	hit = result_cache.get(key)
+	if hit is not None and (model_name is None or model_name in model_registry):
+		# the histogram may have been evicted from plot_store since, it is
+		# redrawn from the cached aggregates (no refit) under the same name
+		f_name = 'plots/{}'.format(charts.histogram(plot_store, hit['aggregates'], fmt=chart_format))
+		return hit['topics'], hit['text_name'], f_name, hit['aggregates']
 
-	# get the vocab from first row
-	vocab = tuple(temp[0])
+	d = len(text)
 
-	# # get document-term matrix from remaining rows
-	X = np.array(temp[1:])
+	# token ids of the corpus, normalized only the first time it is seen
+	shared = os.path.dirname(os.path.abspath(a)) == DATASETS
+	token_key = result_cache.key(upload.hexdigest(), normalizer=normalizer.config(),
+	                             shared_vocabulary=shared)
+	encoded = token_cache.get(token_key)
+	if encoded is None:
+		encoded = token_cache.put(token_key, normalizer.transform(text), shared=shared)
 
+	# sparse CSR document-term matrix, lda.LDA.fit takes it as is
+	X, vocab = token_cache.doc_term(*encoded)
 
-	#tdm.write_csv('matrix.csv', cutoff=1)
-	topics = []
 
-	model = lda.LDA(n_topics, n_iter=500, random_state=2)
+	# n_topics='auto': the count with the best held-out perplexity in a sweep
+	curve = None
+	if n_topics == 'auto':
+		n_topics, curve = select_topics(upload.hexdigest(), X, engine, n_iter)
+
+	# engines.ENGINES: 'gibbs' (lda.LDA) or 'vb' (multi-process variational Bayes)
+	model = make_model(engine, n_topics, n_iter=n_iter, random_state=2)
 	model.fit(X)  # model.fit_transform(X) is also available
 	topic_word = model.topic_word_  # model.components_ also works
-	n_top_words = 8
-	for i, topic_dist in enumerate(topic_word):
-	    topic_words = np.array(vocab)[np.argsort(topic_dist)][:-(n_top_words+1):-1]
-	    topics.append('Topic {}: {}'.format(i+1, ' '.join(topic_words)))
-	    #print('Topic {}: {}'.format(i+1, ' '.join(topic_words)))
+	# topics.top_words: relevance 1 ranks words by p(word | topic), lower
+	# values favour words specific to the topic over the corpus
+	word_prob = np.asarray(X.sum(axis=0), dtype=float).ravel() / X.sum()
+	topics = topic_labels(topic_word, vocab, n_top_words, relevance, word_prob)
 
 	# get results
 	topic_word = model.topic_word_ 
 	doc_topic = model.doc_topic_
 
+	if model_name is not None:
+		model_registry.save(model_name, topic_word, vocab, topics, normalizer.config(),
+		                    topic_word_counts=model.nzw_, eta=model.eta,
+		                    n_documents=d, n_topics=n_topics, n_iter=n_iter,
+		                    engine=engine, n_top_words=n_top_words)
+
 
 	# with open('static/{}'.format(t_name), 'w') as f:
 	#     # create header
@@ -110,28 +143,20 @@ def clem_lda(a):
 		
 	# dat = np.genfromtxt ('static/{}'.format(t_name), delimiter=",")
 
-	M_ = []
-	for i in range(len(number)):
-    		M_.append(doc_topic[i,:]*float(number[i]))
-
-	M = sum(M_)
-	Total = sum(M)
-
-
-	x=np.arange(1, n_topics+1, 1)
-
-
-	ax = sns.barplot(x, M, color='Blue')
-	ax.set(xlabel='Topics', ylabel=number_name)
-	ax.set_title('Total: {} {}'.format(int(Total), number_name))
-	num = 1
-	sns.plt.savefig('static/{}'.format(f_name), dpi=300)
-	plt.clf()
+	# per-topic totals are one matrix-vector product doc_topic.T . amounts
+	aggregates = topic_aggregates(doc_topic, np.array(number, dtype=float))
+	aggregates['number_name'] = number_name
+	if curve is not None:
+		aggregates['sweep'] = curve
+	aggregates['words'] = [t['words'] for t in ranked_topics(
+		topic_word, vocab, n_top_words, relevance, word_prob)]
+	f_name = 'plots/{}'.format(charts.histogram(plot_store, aggregates, fmt=chart_format))
 
-	del ax, M, M_, Total
+	result_cache.put(key, {'doc_topic': doc_topic}, topics=topics, text_name=text_name,
+	                 f_name=f_name, aggregates=aggregates)
 
 
-	return topics, text_name, f_name
+	return topics, text_name, f_name, aggregates
 
 
 
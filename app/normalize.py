@@ -0,0 +1,101 @@
+from __future__ import print_function
+import re
+import string
+
+# separates documents while a whole column is cleaned as one string
+DOC_SEP = '\x00'
+HTML_TAG = re.compile(r'<[^<>\x00]*>')
+
+# One translation table lowercases letters and blanks out everything else.
+# It covers code points 0-255, the rest of unicode text (e.g. /infer JSON) is
+# blanked by NON_ASCII, skipped when the text is ascii.
+_CHARS = ''.join(chr(i) for i in range(256))
+_CLEAN = ''.join(c.lower() if c in string.ascii_letters else
+                 c if c == DOC_SEP else ' ' for c in _CHARS)
+NON_ASCII = re.compile(u'[^\x00-\x7f]+')
+if str is bytes:
+    CLEAN_TABLE = string.maketrans(_CHARS, _CLEAN)
+    UNICODE_TABLE = dict((ord(c), ord(clean)) for c, clean in zip(_CHARS, _CLEAN))
+    is_ascii = lambda text: False
+else:
+    CLEAN_TABLE = UNICODE_TABLE = str.maketrans(_CHARS, _CLEAN)
+    is_ascii = getattr(str, 'isascii', lambda text: not NON_ASCII.search(text))
+
+
+class TokenTable(dict):
+    """ Summary: token -> normalized token, filled on first lookup of each
+        token. Emptied when it reaches max_size tokens, so text from
+        requests (/infer) cannot grow it without bound.
+    """
+
+    def __init__(self, normalize, max_size=100000):
+        self.normalize = normalize
+        self.max_size = max_size
+
+    def __missing__(self, word):
+        if len(self) >= self.max_size:
+            self.clear()
+        norm = self[word] = self.normalize(word)
+        return norm
+
+
+class Normalizer(object):
+    """ Summary: Text normalization for clem_lda: HTML stripping, lowercasing,
+        tokenization, stopword removal, plural stripping and a lemma/synonym
+        map, applied to a whole column of documents at once.
+
+        HTML stripping, lowercasing and punctuation removal (a translation
+        table keeping ascii letters only, see NON_ASCII for the code points
+        it does not cover) run once over the joined column. Each
+        distinct token is normalized once and remembered in a lookup table
+        of at most max_tokens entries, so the per-token cost is a single
+        dict lookup.
+
+        lemmas maps a word to its replacement, e.g. {'genes': 'gene',
+        'modeling': 'model'}. It is looked up after plural stripping.
+    """
+
+    def __init__(self, stopwords=(), lemmas=None, strip_plurals=True, min_len=2,
+                 max_tokens=100000):
+        self.stopwords = frozenset(stopwords)
+        self.lemmas = dict(lemmas or {})
+        self.strip_plurals = strip_plurals
+        self.min_len = min_len
+        self.table = TokenTable(self.normalize_token, max_tokens)
+
+    def config(self):
+        """Everything that changes the output, e.g. for cache keys."""
+        return {'stopwords': sorted(self.stopwords),
+                'lemmas': sorted(self.lemmas.items()),
+                'strip_plurals': self.strip_plurals,
+                'min_len': self.min_len}
+
+    def normalize_token(self, word):
+        """Normalized form of a lowercase token, '' if it is dropped."""
+        if word in self.stopwords or len(word) < self.min_len:
+            return ''
+        if self.strip_plurals and len(word) > 3 and word[-1] == 's' \
+                and word[-2] not in 'isu':
+            word = word[:-1]
+        word = self.lemmas.get(word, word)
+        if word in self.stopwords:
+            return ''
+        return word
+
+    def transform(self, docs):
+        """ Summary: Normalize a column of documents.
+            INPUT: list of strings: raw documents, may contain HTML.
+            OUTPUT: list of lists of tokens, one per document.
+        """
+        if not docs:
+            return []
+        column = HTML_TAG.sub(' ', DOC_SEP.join(docs))
+        if isinstance(column, bytes):
+            column = column.translate(CLEAN_TABLE)
+        else:
+            column = column.translate(UNICODE_TABLE)
+            if not is_ascii(column):
+                column = NON_ASCII.sub(' ', column)
+        lookup = self.table.__getitem__
+        return [list(filter(None, map(lookup, doc.split())))
+                for doc in column.split(DOC_SEP)]
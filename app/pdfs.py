@@ -0,0 +1,130 @@
+from __future__ import print_function
+import logging
+import mimetypes
+import multiprocessing
+import os
+import threading
+import traceback
+
+try:
+    from urllib.parse import unquote, urlsplit
+except ImportError:
+    from urllib import unquote
+    from urlparse import urlsplit
+
+log = logging.getLogger(__name__)
+
+# Host of the pages as the worker lays them out: their own URLs (static files
+# referenced as '../SFBanner.jpg' or '/plots/<hash>.png') resolve under it
+# and are read from the static folder, anything else is fetched as usual.
+LOCAL = 'http://report.local'
+
+
+def static_fetcher(static_folder):
+    """WeasyPrint url_fetcher reading the site's own URLs from static_folder."""
+    from weasyprint import default_url_fetcher
+    root = os.path.realpath(static_folder)
+
+    def fetch(url):
+        if not url.startswith(LOCAL + '/'):
+            return default_url_fetcher(url)
+        path = os.path.realpath(os.path.join(root, unquote(urlsplit(url).path).lstrip('/')))
+        if not path.startswith(root + os.sep):
+            raise ValueError('{} is outside of the static folder'.format(url))
+        with open(path, 'rb') as f:
+            return {'string': f.read(), 'mime_type': mimetypes.guess_type(path)[0],
+                    'redirected_url': url}
+    return fetch
+
+
+def write_pdf(html, url, static_folder, out):
+    """ Summary: Lay out a rendered page into a PDF file, in a worker process.
+        INPUT: string: the page's HTML.
+               string: path the page is served at, e.g. '/stat_pdf/<name>',
+               relative URLs in it are resolved against it.
+               string: folder the site's static files are read from.
+               string: output path.
+        OUTPUT: None, or the traceback of the failure as a string.
+    """
+    try:
+        from weasyprint import HTML
+        HTML(string=html, base_url=LOCAL + url,
+             url_fetcher=static_fetcher(static_folder)).write_pdf(out)
+    except Exception:
+        return traceback.format_exc()
+
+
+class ReportStore(object):
+    """ Summary: PDF reports kept in an ArtifactStore as <name>.pdf, so a
+        report is laid out once and then served as a plain file (with
+        ETag/Last-Modified from its mtime).
+
+        Pages are rendered to HTML by the caller, which is quick, and laid
+        out by write_pdf in a process pool of their own, so the layout does
+        not hold the GIL of the web process nor wait behind topic modeling
+        jobs. The pool is started by the first render_async(). Nobody waits
+        for a PDF: render_async() queues it and records a failure, see
+        status().
+    """
+
+    def __init__(self, store, static_folder, processes=1):
+        self.store = store
+        self.static_folder = static_folder
+        self.processes = processes
+        self.pool = None
+        self.rendering = set()
+        self.failed = {}
+        self.lock = threading.Lock()
+
+    def path(self, name):
+        return os.path.join(self.store.root, name + '.pdf')
+
+    def fresh(self, name, source=None):
+        """Whether name.pdf is stored and newer than the source file, if given."""
+        try:
+            mtime = os.stat(self.path(name)).st_mtime
+        except OSError:
+            return False
+        return source is None or os.path.getmtime(source) <= mtime
+
+    def status(self, name):
+        """'rendering', 'failed', or None if no render of name is known."""
+        with self.lock:
+            if name in self.rendering:
+                return 'rendering'
+            if name in self.failed:
+                return 'failed'
+        return None
+
+    def _finish(self, name, tmp, error):
+        if error is None:
+            self.store.add(tmp, '.pdf', key=name)
+        else:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            log.error('rendering %s.pdf failed\n%s', name, error)
+        return error
+
+    def render_async(self, name, html, url):
+        """Queue the layout of name.pdf, unless it is queued or failed already."""
+        with self.lock:
+            if name in self.rendering or name in self.failed:
+                return
+            self.rendering.add(name)
+            if self.pool is None:
+                self.pool = multiprocessing.Pool(self.processes)
+        tmp = self.store.new_file('.pdf')
+
+        def done(error):
+            # on the pool's result thread, which must not raise
+            try:
+                self._finish(name, tmp, error)
+            except Exception:
+                log.exception('storing %s.pdf failed', name)
+                error = error or traceback.format_exc()
+            finally:
+                with self.lock:
+                    self.rendering.discard(name)
+                    if error is not None:
+                        self.failed[name] = error
+        self.pool.apply_async(write_pdf, (html, url, self.static_folder, tmp), callback=done)
@@ -0,0 +1,184 @@
+from __future__ import print_function
+import json
+import os
+import threading
+import numpy as np
+import scipy.sparse as sp
+from dtm import build_dtm
+from normalize import Normalizer
+from topics import topic_labels, ranked_topics
+
+
+class TopicModel(object):
+    """ Summary: A fitted topic model reduced to what inference needs:
+        topic_word_, the vocabulary, the topic labels and the Normalizer
+        settings the corpus was cleaned with.
+
+        transform() folds new documents in with topic_word_ held fixed, so
+        scoring an abstract does not refit the corpus. update() adds new
+        documents to the topic-word counts, see below.
+    """
+
+    def __init__(self, topic_word, vocab, topics, normalizer_config,
+                 topic_word_counts=None, params=None):
+        self.topic_word_ = np.asarray(topic_word, dtype=float)
+        self.topic_word_counts_ = topic_word_counts
+        self.vocab = list(vocab)
+        self.topics = list(topics)
+        self.normalizer_config = normalizer_config
+        self.normalizer = Normalizer(**normalizer_config)
+        self.word_index = dict((w, j) for j, w in enumerate(self.vocab))
+        self.params = params or {}
+
+    def doc_term(self, docs):
+        """Count matrix of raw documents over the model's vocabulary."""
+        X, _ = build_dtm(self.normalizer.transform(docs), tokenizer=None,
+                         vocabulary=self.word_index)
+        return X
+
+    def transform(self, docs, n_iter=20, alpha=0.1):
+        """ Summary: Topic mixture of new documents.
+            INPUT: list of strings: raw documents.
+                   int: fold-in iterations.
+                   float: Dirichlet prior on document topics.
+            OUTPUT: numpy array (docs x topics), rows sum to 1. Documents
+                    without any known word get the uniform mixture.
+        """
+        return fold_in(sp.coo_matrix(self.doc_term(docs)), self.topic_word_,
+                       n_iter, alpha)
+
+    def ranked_topics(self, n_top_words=8, lam=1.0):
+        """topics.ranked_topics of the model, p(word) from the saved counts."""
+        word_prob = None
+        if self.topic_word_counts_ is not None:
+            counts = self.topic_word_counts_.sum(axis=0)
+            word_prob = counts / counts.sum()
+        return ranked_topics(self.topic_word_, self.vocab, n_top_words, lam, word_prob)
+
+    def update(self, docs, n_iter=20, alpha=0.1):
+        """ Summary: Add new documents to the model without refitting.
+            INPUT: list of strings: raw documents of the new batch.
+            OUTPUT: numpy array: topic mixtures of the new documents.
+
+            Unknown words extend the vocabulary. The batch is folded in
+            with the current topics, and the expected topic of each of its
+            tokens is added to the saved topic-word counts. This is one
+            incremental EM step, and its cost depends on the batch only.
+        """
+        if self.topic_word_counts_ is None:
+            raise ValueError('model saved without topic-word counts, refit it')
+        eta = self.params.get('eta', 0.01)
+        n_old = len(self.vocab)
+        X, vocab = build_dtm(self.normalizer.transform(docs), tokenizer=None,
+                             vocabulary=self.word_index, grow=True)
+        X = sp.coo_matrix(X)
+        counts = np.zeros((self.topic_word_counts_.shape[0], len(vocab)))
+        counts[:, :n_old] = self.topic_word_counts_
+        phi = (counts + eta) / (counts.sum(axis=1) + len(vocab) * eta)[:, np.newaxis]
+
+        theta = fold_in(X, phi, n_iter, alpha)
+        # expected counts of each (document, word) pair per topic
+        resp = theta[X.row] * phi[:, X.col].T
+        resp *= (X.data / resp.sum(axis=1))[:, np.newaxis]
+        words = sp.csr_matrix((np.ones(X.nnz), (X.col, np.arange(X.nnz))),
+                              shape=(len(vocab), X.nnz))
+        counts += words.dot(resp).T
+
+        self.vocab = vocab
+        self.topic_word_counts_ = counts
+        self.topic_word_ = (counts + eta) / (counts.sum(axis=1) + len(vocab) * eta)[:, np.newaxis]
+        self.topics = topic_labels(self.topic_word_, vocab,
+                                   self.params.get('n_top_words', 8))
+        self.params['n_documents'] = self.params.get('n_documents', 0) + X.shape[0]
+        return theta
+
+
+def fold_in(X, phi, n_iter=20, alpha=0.1):
+    """Topic mixtures of the rows of a COO count matrix, phi held fixed."""
+    n_topics = phi.shape[0]
+    theta = np.ones((X.shape[0], n_topics)) / n_topics
+    for it in range(n_iter):
+        # p(word | doc) under the current mixtures, at the nonzeros only
+        p = (theta[X.row] * phi[:, X.col].T).sum(axis=1)
+        R = sp.csr_matrix((X.data / p, (X.row, X.col)), shape=X.shape)
+        theta = theta * R.dot(phi.T) + alpha
+        theta /= theta.sum(axis=1)[:, np.newaxis]
+    return theta
+
+
+class ModelRegistry(object):
+    """ Summary: Fitted topic models saved per dataset name under root:
+        <name>.npz (topic_word_, its counts, vocabulary) and <name>.json
+        (topic labels, Normalizer settings, fit parameters). Loaded models
+        stay in memory until the files on disk change.
+    """
+
+    def __init__(self, root='models'):
+        self.root = root
+        self.models = {}
+        self.lock = threading.Lock()
+        if not os.path.isdir(root):
+            os.makedirs(root)
+
+    def _path(self, name, ext):
+        return os.path.join(self.root, name + ext)
+
+    def names(self):
+        return sorted(os.path.splitext(f)[0] for f in os.listdir(self.root)
+                      if f.endswith('.json'))
+
+    def __contains__(self, name):
+        return os.path.exists(self._path(name, '.json'))
+
+    def save(self, name, topic_word, vocab, topics, normalizer_config,
+             topic_word_counts=None, **params):
+        arrays = {'topic_word': topic_word, 'vocab': np.array(vocab)}
+        if topic_word_counts is not None:
+            arrays['topic_word_counts'] = topic_word_counts
+        tmp = self._path(name, '.tmp.npz')
+        np.savez_compressed(tmp, **arrays)
+        os.rename(tmp, self._path(name, '.npz'))
+        meta = {'topics': topics, 'normalizer': normalizer_config,
+                'params': params}
+        tmp = self._path(name, '.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+        os.rename(tmp, self._path(name, '.json'))
+        with self.lock:
+            self.models.pop(name, None)
+
+    def _read(self, name):
+        with open(self._path(name, '.json')) as f:
+            meta = json.load(f)
+        arrays = np.load(self._path(name, '.npz'))
+        counts = arrays['topic_word_counts'] if 'topic_word_counts' in arrays else None
+        return TopicModel(arrays['topic_word'], arrays['vocab'].tolist(),
+                          meta['topics'], meta['normalizer'],
+                          topic_word_counts=counts, params=meta['params'])
+
+    def load(self, name):
+        """Return the TopicModel saved as name, KeyError if there is none."""
+        try:
+            mtime = os.stat(self._path(name, '.json')).st_mtime
+        except OSError:
+            raise KeyError(name)
+        with self.lock:
+            loaded, model = self.models.get(name, (None, None))
+            if loaded != mtime:
+                model = self._read(name)
+                self.models[name] = (mtime, model)
+        return model
+
+    def update(self, name, docs, **kwargs):
+        """Add a batch of documents to a saved model and publish the result.
+
+        Works on its own copy, models already served by load() are replaced
+        only once the new files are in place.
+        """
+        if name not in self:
+            raise KeyError(name)
+        model = self._read(name)
+        model.update(docs, **kwargs)
+        self.save(name, model.topic_word_, model.vocab, model.topics,
+                  model.normalizer_config, model.topic_word_counts_, **model.params)
+        return model
@@ -0,0 +1,24 @@
+from __future__ import print_function
+import sys
+from columnar import open_table
+from nlq import normalizer, select_topics, TOPIC_COUNTS
+from dtm import build_dtm
+
+# Held-out perplexity and coherence over a range of topic counts, and the
+# count clem_lda(n_topics='auto') would pick. Cached in cache/sweeps.
+#   python select_topics.py data/NSF_plasma.csv [5 10 15 ...]
+
+
+if __name__ == '__main__':
+    a = sys.argv[1]
+    topic_counts = [int(k) for k in sys.argv[2:]] or TOPIC_COUNTS
+    upload = open_table(a)
+    number, text = upload.columns()
+    X, vocab = build_dtm(normalizer.transform(text), tokenizer=None)
+    best, curve = select_topics(upload.hexdigest(), X, topic_counts=topic_counts)
+    print('{:>8} {:>11} {:>10} {:>11}'.format('n_topics', 'perplexity', 'coherence', 'iterations'))
+    for c in curve:
+        print('{:>8} {:>11.1f} {:>10.2f} {:>11}{}'.format(
+            c['n_topics'], c['perplexity'], c['coherence'], c['iterations'],
+            '  stopped early' if c['stopped'] else ''))
+    print('best:', best)
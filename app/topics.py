@@ -0,0 +1,86 @@
+from __future__ import print_function
+import numpy as np
+
+
+def top_words(topic_word, n_top_words=8, lam=1.0, word_prob=None):
+    """ Summary: Indices of the top words of every topic, best first.
+        INPUT: numpy array: topic_word_ (topics x vocab).
+               int: words per topic.
+               float: relevance weight lambda (Sievert & Shirley 2014),
+               1 ranks by p(word | topic), 0 by lift p(word | topic) / p(word).
+               numpy array: p(word), by default the mean over topics.
+        OUTPUT: numpy array (topics x n_top_words) of word indices.
+
+        One argpartition over all topics picks the candidates in linear
+        time, only those n_top_words per topic are then sorted.
+    """
+    topic_word = np.asarray(topic_word, dtype=float)
+    if lam == 1:
+        scores = topic_word
+    else:
+        if word_prob is None:
+            word_prob = topic_word.mean(axis=0)
+        with np.errstate(divide='ignore'):
+            log_phi = np.log(topic_word)
+            scores = lam * log_phi + (1 - lam) * (log_phi - np.log(word_prob))
+    k = min(n_top_words, scores.shape[1])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    rows = np.arange(scores.shape[0])[:, np.newaxis]
+    return top[rows, np.argsort(-scores[rows, top], axis=1)]
+
+
+def ranked_topics(topic_word, vocab, n_top_words=8, lam=1.0, word_prob=None):
+    """ Summary: Top words of every topic as JSON-ready dicts,
+        [{'topic': 1, 'words': [{'word': w, 'weight': p(w | topic)}, ...]}, ...]
+        ranked as in top_words().
+    """
+    topic_word = np.asarray(topic_word, dtype=float)
+    top = top_words(topic_word, n_top_words, lam, word_prob)
+    words = np.asarray(vocab)[top]
+    weights = topic_word[np.arange(len(top))[:, np.newaxis], top]
+    return [{'topic': i+1,
+             'words': [{'word': w, 'weight': p} for w, p in zip(ws.tolist(), ps.tolist())]}
+            for i, (ws, ps) in enumerate(zip(words, weights))]
+
+
+def topic_labels(topic_word, vocab, n_top_words=8, lam=1.0, word_prob=None):
+    """'Topic k: w1 w2 ...' with the n_top_words best ranked words of each topic."""
+    words = np.asarray(vocab)[top_words(topic_word, n_top_words, lam, word_prob)]
+    return ['Topic {}: {}'.format(i+1, ' '.join(ws)) for i, ws in enumerate(words)]
+
+
+def umass_coherence(X, topic_word, n_top_words=10):
+    """ Summary: UMass coherence of each topic's top words (Mimno et al. 2011).
+        INPUT: scipy.sparse matrix: document-term counts the model was fit on.
+               numpy array: topic_word_ (topics x vocab).
+               int: number of top words scored per topic.
+        OUTPUT: numpy array with one score per topic, closer to 0 is better.
+    """
+    B = (X > 0).astype(np.intc).tocsc()
+    # pairs (i, j) with word j ranked above word i
+    i, j = np.tril_indices(n_top_words, -1)
+    scores = []
+    for top in top_words(topic_word, n_top_words):
+        sub = B[:, top]
+        co = (sub.T * sub).toarray()
+        df = np.maximum(np.diag(co), 1)
+        scores.append(np.sum(np.log((co[i, j] + 1.) / df[j])))
+    return np.array(scores)
+
+
+def topic_aggregates(doc_topic, amounts):
+    """ Summary: Amount (e.g. funding) attributed to each topic.
+        INPUT: numpy array: doc_topic_ (docs x topics).
+               numpy array: amount of each document.
+        OUTPUT: dict: total amount, and per topic the amount weighted by
+                topic probability, its share of the total and the number of
+                documents whose main topic it is.
+    """
+    totals = doc_topic.T.dot(amounts)
+    total = totals.sum()
+    shares = totals / total if total else np.zeros_like(totals)
+    documents = np.bincount(doc_topic.argmax(axis=1), minlength=doc_topic.shape[1])
+    return {'total': float(total),
+            'totals': totals.tolist(),
+            'shares': shares.tolist(),
+            'documents': documents.tolist()}
@@ -0,0 +1,18 @@
+from __future__ import print_function
+import sys
+from ingest import Upload
+from nlq import model_registry
+
+# Add the new rows of a dataset to its saved topic model and publish the
+# refreshed topics, without refitting the whole corpus.
+#   python update_model.py <name> <csv with only the new rows>
+
+
+if __name__ == '__main__':
+    name, a = sys.argv[1], sys.argv[2]
+    docs = [t for n, t in Upload(a).rows()]
+    model = model_registry.update(name, docs)
+    print('{}: {} documents, {} words'.format(
+        name, model.params['n_documents'], len(model.vocab)))
+    for topic in model.topics:
+        print(topic)
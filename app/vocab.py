@@ -0,0 +1,171 @@
+from __future__ import print_function
+import fcntl
+import os
+from itertools import chain
+import numpy as np
+import scipy.sparse as sp
+from cache import ResultCache
+
+
+def pack(docs, index):
+    """ids and offsets of tokenized documents, see Vocabulary.encode."""
+    ids = np.fromiter((index[t] for t in chain.from_iterable(docs)),
+                      dtype=np.int32)
+    offsets = np.zeros(len(docs) + 1, dtype=np.int64)
+    np.cumsum([len(doc) for doc in docs], out=offsets[1:])
+    return ids, offsets
+
+
+def encode_corpus(docs):
+    """ Summary: Ids of tokenized documents over a vocabulary of their own,
+        numbered in order of first appearance.
+        INPUT: list of lists of tokens (Normalizer.transform output).
+        OUTPUT: ids and offsets as from Vocabulary.encode, numpy array of
+                the corpus' words indexed by id.
+    """
+    index = {}
+    for token in chain.from_iterable(docs):
+        if token not in index:
+            index[token] = len(index)
+    words = np.array(sorted(index, key=index.get), dtype=str)
+    return pack(docs, index) + (words,)
+
+
+class Vocabulary(object):
+    """ Summary: Token -> int id map shared by several corpora, persisted
+        in one file with a token per line (the line number is the id).
+
+        Ids never change: new tokens are appended under an exclusive lock
+        and other processes read the tail the next time they encode, so
+        token arrays stored with these ids stay valid. words() is the
+        id -> token numpy array, for indexing with id arrays.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.index = {}
+        self.tokens = []
+        self.offset = 0
+        self._words = None
+        if not os.path.exists(path):
+            open(path, 'a').close()
+
+    def _refresh(self, f):
+        """Read the tokens other processes appended since the last call."""
+        f.seek(0, os.SEEK_END)
+        if f.tell() < self.offset:
+            # the file was removed and started over
+            self.index, self.tokens, self.offset = {}, [], 0
+        f.seek(self.offset)
+        tail = f.read()
+        self.offset += len(tail)
+        for token in (tail if str is bytes else tail.decode('ascii')).split():
+            self.index[token] = len(self.tokens)
+            self.tokens.append(token)
+
+    def encode(self, docs):
+        """ Summary: Ids of tokenized documents, new tokens get new ids.
+            INPUT: list of lists of tokens (Normalizer.transform output).
+            OUTPUT: numpy int32 array: ids of all tokens, back to back.
+                    numpy int64 array: offsets, document i is
+                    ids[offsets[i]:offsets[i+1]].
+        """
+        with open(self.path, 'a+b') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            self._refresh(f)
+            index = self.index
+            new = []
+            for token in chain.from_iterable(docs):
+                if token not in index:
+                    index[token] = len(self.tokens) + len(new)
+                    new.append(token)
+            if new:
+                data = ('\n'.join(new) + '\n').encode('ascii')
+                f.seek(0, os.SEEK_END)
+                f.write(data)
+                self.offset += len(data)
+                self.tokens.extend(new)
+        return pack(docs, index)
+
+    def words(self, size=0):
+        """numpy array of the tokens indexed by id, at least size of them."""
+        if len(self.tokens) < size:
+            with open(self.path, 'rb') as f:
+                fcntl.flock(f, fcntl.LOCK_SH)
+                self._refresh(f)
+            if len(self.tokens) < size:
+                raise KeyError('{} has {} tokens, not {}'.format(
+                    self.path, len(self.tokens), size))
+        if self._words is None or len(self._words) != len(self.tokens):
+            self._words = np.array(self.tokens)
+        return self._words
+
+
+class TokenCache(ResultCache):
+    """ Summary: Normalized corpora stored as int32 token ids, so rerunning
+        a dataset with other model parameters skips HTML stripping and
+        tokenization altogether.
+
+        Entries are keyed like ResultCache entries (content hash plus the
+        Normalizer settings) and evicted the same way. Corpora put with
+        shared=True (the bundled datasets) are encoded over one Vocabulary,
+        whose file lives in the same root and is never evicted. Any other
+        corpus (uploads) keeps a vocabulary of its own in its entry, so it
+        goes with the entry and cannot grow what every worker loads.
+    """
+
+    def __init__(self, root='tokens', max_bytes=64 * 2**20):
+        ResultCache.__init__(self, root, max_bytes)
+        self.vocabulary = Vocabulary(os.path.join(root, 'datasets.txt'))
+
+    def get(self, key):
+        """(ids, offsets, words) of a cached corpus, or None on a miss."""
+        entry = ResultCache.get(self, key)
+        if entry is None:
+            return None
+        ids = entry['ids']
+        if 'words' in entry:
+            return ids, entry['offsets'], entry['words']
+        try:
+            words = self.vocabulary.words(int(ids.max()) + 1 if len(ids) else 0)
+        except KeyError:
+            # the vocabulary file was removed under this entry
+            return None
+        return ids, entry['offsets'], words
+
+    def put(self, key, docs, shared=False):
+        """ Summary: Encode tokenized documents, store them.
+            INPUT: string: entry key.
+                   list of lists of tokens (Normalizer.transform output).
+                   bool: encode over the shared Vocabulary, for the bundled
+                   datasets only.
+            OUTPUT: (ids, offsets, words), as from get().
+        """
+        if shared:
+            ids, offsets = self.vocabulary.encode(docs)
+            ResultCache.put(self, key, {'ids': ids, 'offsets': offsets})
+            return ids, offsets, self.vocabulary.words()
+        ids, offsets, words = encode_corpus(docs)
+        ResultCache.put(self, key, {'ids': ids, 'offsets': offsets, 'words': words})
+        return ids, offsets, words
+
+    def doc_term(self, ids, offsets, words):
+        """ Summary: Sparse document-term counts of an encoded corpus.
+            INPUT: ids, offsets and words, as from get() or put().
+            OUTPUT: scipy.sparse CSR matrix (docs x words) of int counts,
+                    numpy array of the words of its columns.
+
+            Columns are the corpus' own words, numbered in order of first
+            appearance, so the matrix is the one dtm.build_dtm builds from
+            the tokens.
+        """
+        uniq, first, inverse = np.unique(ids, return_index=True, return_inverse=True)
+        order = np.argsort(first)
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        rows = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+        X = sp.csr_matrix((np.ones(len(ids), dtype=np.intc),
+                           (rows, rank[inverse.ravel()])),
+                          shape=(len(offsets) - 1, len(uniq)), dtype=np.intc)
+        X.sum_duplicates()
+        return X, words[uniq[order]]
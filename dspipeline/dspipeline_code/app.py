@@ -9,13 +9,16 @@ from forms import *
 import os
 import pymongo
 import predict
+import dedup
+import store
+import atexit
 import json
 import time
 from datetime import datetime
 import socket
 import requests
 import bokeh
-import hashlib
+from collections import OrderedDict
 import pandas as pd
 import numpy as np
 
@@ -27,6 +30,22 @@ app = Flask(__name__)
 app.config.from_object('config')
 PORT = 5353
 REGISTER_URL = "http://10.3.32.217:5000/register"
+# Events per clean/predict/insert round of /score_batch
+SCORE_BATCH_MAX = 10000
+# /score predicts with the model flattened into numpy arrays (same
+# probabilities, a fraction of the latency), False: the sklearn model
+FAST_SCORING = True
+# Ids the in-process duplicate check holds: all stored (Bloom filter, grows
+# less exact past this) and most recent (LRU)
+DEDUP_CAPACITY = 10**6
+DEDUP_RECENT = 10**5
+# /score writes in the background: documents buffered at most, per batch,
+# and seconds before a partial batch is written; seconds a batch is retried
+# while Mongo is unreachable
+WRITE_BUFFER = 10000
+WRITE_BATCH = 1000
+WRITE_INTERVAL = 0.2
+WRITE_RETRY = 60
 DATA = []
 TIMESTAMP = []
 
@@ -35,6 +54,21 @@ db = client['fraud-streaming']
 col = db['test_data']
 
 model = predict.get_model()
+# Event -> feature matrix, built once from models/model_columns.pkl
+transformer = predict.get_transformer()
+scorer = predict.compile_model(model) if FAST_SCORING else model
+seen_ids = dedup.SeenIds(DEDUP_CAPACITY, DEDUP_RECENT)
+seen_ids.load(doc['_id'] for doc in col.find({}, {'_id': 1}))
+
+
+def mark_stored(docs):
+    # ids are seen once written: a dropped batch can be sent again
+    for doc in docs:
+        seen_ids.add(doc['_id'])
+
+writer = store.BackgroundWriter(col, WRITE_BUFFER, WRITE_BATCH, WRITE_INTERVAL,
+                                WRITE_RETRY, on_written=mark_stored)
+atexit.register(writer.close)
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
@@ -68,27 +102,125 @@ def about():
 
 @app.route('/score', methods=['POST'])
 def score():
-    jsons = json.dumps(request.json, sort_keys=True, indent=4, separators=(',', ':'))
-    m = hashlib.sha224(jsons).hexdigest()
-    if col.find_one({'_id': m}) is None:
-       print "New Point"
-       timepoint = time.time()
-
-       datapoint_dict = json.loads(jsons)
-       df = pd.DataFrame.from_dict(datapoint_dict, orient='index').T
-       df = predict.clean_json(df)
-       predictions = predict.get_predictions(df, model)
-       datapoint_dict['predicts'] = tuple(predictions[0])
-       datapoint_dict['time'] = timepoint
-
-       datapoint_json = json.dumps(datapoint_dict)
-
-       col.insert_one({'_id': m, 'data': datapoint_json})
-    else:
+    datapoint_dict = dict(request.json)
+    m = dedup.event_id(datapoint_dict)
+    if seen_ids.check(m):
         print "Seen this point"
+        return ""
+    # not known in process: score it, $setOnInsert keeps a stored copy as is
+    print "New Point"
+    timepoint = time.time()
+
+    X = transformer.transform([datapoint_dict])
+    predictions = predict.get_predictions(X, scorer)
+    datapoint_dict['predicts'] = tuple(predictions[0])
+    datapoint_dict['time'] = timepoint
+
+    datapoint_json = json.dumps(datapoint_dict)
+
+    if not writer.put({'_id': m, 'data': datapoint_json}):
+        # write buffer full, Mongo is behind: ask the sender to retry
+        return "", 503
     return ""
 
 
+def score_events(events):
+    """ Summary: Score a batch of events with one transform / get_predictions
+        pass over the whole matrix, and store the new ones with one
+        store.insert_if_absent round trip.
+        INPUT: list of dicts: raw events, as posted to /score.
+        OUTPUT: list of (id, predicts) of the events scored now, and the
+                number of events already stored (or repeated in the batch).
+    """
+    ids = [dedup.event_id(event) for event in events]
+    known = [(m, seen_ids.check(m)) for m in ids]
+    seen = set(m for m, stored in known if stored)
+    ask = [m for m, stored in known if stored is None]
+    if ask:
+        seen.update(doc['_id'] for doc in col.find({'_id': {'$in': ask}}, {'_id': 1}))
+    new = OrderedDict()
+    for m, event in zip(ids, events):
+        if m not in seen and m not in new:
+            new[m] = event
+    for m in seen:
+        seen_ids.add(m)
+    if not new:
+        return [], len(events)
+
+    timepoint = time.time()
+    X = transformer.transform(list(new.values()))
+    predictions = predict.get_predictions(X, model)
+
+    results = []
+    docs = []
+    for (m, event), predicts in zip(new.items(), predictions):
+        datapoint_dict = dict(event, predicts=tuple(predicts), time=timepoint)
+        docs.append({'_id': m, 'data': json.dumps(datapoint_dict)})
+        results.append((m, datapoint_dict['predicts']))
+    store.insert_if_absent(col, docs)
+    for m in new:
+        seen_ids.add(m)
+    return results, len(events) - len(new)
+
+def stream_lines(stream, chunk_size=1 << 16):
+    """ Summary: Lines of a request body, read in chunks: newer Werkzeug
+        streams iterate their lines one byte read at a time.
+    """
+    tail = b''
+    for chunk in iter(lambda: stream.read(chunk_size), b''):
+        lines = (tail + chunk).split(b'\n')
+        tail = lines.pop()
+        for line in lines:
+            yield line
+    if tail:
+        yield tail
+
+def read_events(limit):
+    """ Summary: Events posted to /score_batch, in lists of at most limit:
+        a json object or array of objects, or NDJSON (one object per line)
+        read from the body as it streams in. Malformed json or anything
+        but objects is a 400, NDJSON batches before it are already stored.
+    """
+    if request.mimetype == 'application/json':
+        events = request.get_json()
+        if isinstance(events, dict):
+            events = [events]
+        if not isinstance(events, list) or \
+                not all(isinstance(event, dict) for event in events):
+            flask.abort(400)
+        for i in range(0, len(events), limit):
+            yield events[i:i + limit]
+        return
+    batch = []
+    for line in stream_lines(request.stream):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            event = json.loads(line)
+        except ValueError:
+            flask.abort(400)
+        if not isinstance(event, dict):
+            flask.abort(400)
+        batch.append(event)
+        if len(batch) == limit:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+@app.route('/score_batch', methods=['POST'])
+def score_batch():
+    results = []
+    seen = 0
+    for events in read_events(SCORE_BATCH_MAX):
+        scored, repeated = score_events(events)
+        results.extend(scored)
+        seen += repeated
+    return jsonify(scored=len(results), seen=seen,
+                   results=[{'id': m, 'predicts': p} for m, p in results])
+
+
 @app.route('/barchart')
 def barchart():
     return render_template('pages/placeholder.barchart.html')
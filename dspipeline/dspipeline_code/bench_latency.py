@@ -0,0 +1,49 @@
+import sys
+import json
+import time
+import numpy as np
+import pandas as pd
+import predict
+
+# Single-event scoring latency (p50/p99 in ms) of the three paths /score can
+# take: event -> DataFrame -> clean_json -> model, event -> transformer ->
+# model, and event -> transformer -> compile_model(model). Needs the pickled
+# model only, no MongoDB.
+#   python bench_latency.py [test_script_examples.json] [repeats]
+
+
+def latencies(events, score):
+    times = []
+    for event in events:
+        start = time.time()
+        score(event)
+        times.append(time.time() - start)
+    return np.array(times) * 1000
+
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else 'test_script_examples.json'
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    events = json.load(open(path))
+    if isinstance(events, dict):
+        events = [events]
+    events = [events[i % len(events)] for i in range(repeats)]
+
+    model = predict.get_model()
+    transformer = predict.get_transformer()
+    fast = predict.compile_model(model)
+    paths = [
+        ('pandas', lambda e: model.predict_proba(
+            predict.clean_json(pd.DataFrame([e]), transformer))),
+        ('numpy', lambda e: model.predict_proba(transformer.transform([e]))),
+        ('numpy + ' + type(fast).__name__,
+         lambda e: fast.predict_proba(transformer.transform([e]))),
+    ]
+    X = transformer.transform(events)
+    print "max |p - sklearn p|: {:.2g}".format(
+        np.abs(fast.predict_proba(X) - model.predict_proba(X)).max())
+    for name, score in paths:
+        score(events[0])
+        t = latencies(events, score)
+        print "{:<30} p50 {:>7.3f} ms   p99 {:>7.3f} ms".format(
+            name, np.percentile(t, 50), np.percentile(t, 99))
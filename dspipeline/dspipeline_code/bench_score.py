@@ -0,0 +1,47 @@
+import sys
+import json
+import time
+import app as server
+
+# Events per second through /score (one call per event) and /score_batch,
+# at batch sizes 1, 100 and 10000. Needs the local MongoDB and the pickled
+# model, writes to a scratch collection that is dropped afterwards.
+#   python bench_score.py [test_script_examples.json]
+
+
+def make_events(template, n, start):
+    # a distinct field per event, so none of them is deduplicated
+    return [dict(template, bench_seq=start + i) for i in range(n)]
+
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else 'test_script_examples.json'
+    template = json.load(open(path))
+    if isinstance(template, list):
+        template = template[0]
+    server.col = server.db['score_bench']
+    server.writer.collection = server.col
+    client = server.app.test_client()
+    seq = 0
+    try:
+        events = make_events(template, 200, seq)
+        seq += len(events)
+        start = time.time()
+        for event in events:
+            client.post('/score', data=json.dumps(event), content_type='application/json')
+        server.writer.flush()
+        elapsed = time.time() - start
+        print "{:<22} {:>8.0f} events/s".format('/score', len(events) / elapsed)
+
+        for size in (1, 100, 10000):
+            n = max(size, 200) if size < 10000 else size
+            events = make_events(template, n, seq)
+            seq += len(events)
+            start = time.time()
+            for i in range(0, n, size):
+                body = '\n'.join(json.dumps(e) for e in events[i:i + size])
+                client.post('/score_batch', data=body, content_type='application/x-ndjson')
+            elapsed = time.time() - start
+            print "{:<22} {:>8.0f} events/s".format('/score_batch x{}'.format(size), n / elapsed)
+    finally:
+        server.db.drop_collection('score_bench')
@@ -0,0 +1,106 @@
+import hashlib
+import json
+import math
+import threading
+from collections import OrderedDict
+
+# Encoder for canonical(): compact, and without sort_keys (canonical() sorts),
+# which would switch Python 2's json to its pure Python encoder.
+_encoder = json.JSONEncoder(separators=(',', ':'))
+_nested = (dict, list)
+
+
+def canonical(obj):
+    """ Summary: Event with key order made irrelevant, for hashing: dicts become
+        lists of (key, value) pairs sorted by key and lists become {"": list},
+        so the two cannot be confused.
+        INPUT: dict: Parsed json event.
+        OUTPUT: list: Json-encodable structure, the same for equal events.
+    """
+    if isinstance(obj, dict):
+        return [(key, canonical(value) if isinstance(value, _nested) else value)
+                for key, value in sorted(obj.items())]
+    if isinstance(obj, list):
+        return {'': [canonical(value) if isinstance(value, _nested) else value
+                     for value in obj]}
+    return obj
+
+
+def event_id(event):
+    """ Summary: Mongo _id of an event: md5 of its compact canonical json.
+        Equal events get equal ids whatever their key order or whitespace.
+        INPUT: dict: Parsed json event.
+        OUTPUT: string: 32 hex digits.
+    """
+    # content id, not a security check: md5 is the fastest hashlib has
+    return hashlib.md5(_encoder.encode(canonical(event))).hexdigest()
+
+
+class BloomFilter(object):
+    """ Summary: Set of hex ids answering "definitely not in it" or "maybe in
+        it", in about 10 bits per id for a 1% false positive rate. The bit
+        positions are taken from the id itself, which is already a hash.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.bits = int(-capacity * math.log(error_rate) / math.log(2) ** 2) or 8
+        self.hashes = max(1, int(round(self.bits / float(capacity) * math.log(2))))
+        self.array = bytearray((self.bits + 7) // 8)
+
+    def _positions(self, key):
+        h = int(key, 16)
+        h1, h2 = h & 0xffffffffffffffff, (h >> 64) | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, key):
+        for p in self._positions(key):
+            self.array[p >> 3] |= 1 << (p & 7)
+
+    def __contains__(self, key):
+        array = self.array
+        return all(array[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+
+class SeenIds(object):
+    """ Summary: In-process index of the event ids already stored, in front of
+        the Mongo duplicate check. An LRU of recent ids answers "seen" and a
+        Bloom filter of every id known answers "new" without a query, only
+        ids in the filter but not in the LRU still go to Mongo.
+
+        The filter knows the ids loaded with load() and those added since,
+        ids stored by other processes meanwhile are only caught when their
+        insert hits the duplicate key.
+    """
+
+    def __init__(self, capacity=10**6, recent=10**5, error_rate=0.01):
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.recent = OrderedDict()
+        self.max_recent = recent
+        self.lock = threading.Lock()
+
+    def load(self, ids):
+        """Add ids already stored, e.g. every _id of the collection at startup."""
+        with self.lock:
+            for key in ids:
+                self.bloom.add(key)
+
+    def add(self, key):
+        with self.lock:
+            self.bloom.add(key)
+            self.recent.pop(key, None)
+            self.recent[key] = True
+            if len(self.recent) > self.max_recent:
+                self.recent.popitem(last=False)
+
+    def check(self, key):
+        """ Summary: What is known of an id without asking Mongo.
+            INPUT: string: Event id.
+            OUTPUT: True: stored, False: not stored, None: ask Mongo.
+        """
+        with self.lock:
+            if key in self.recent:
+                self.recent[key] = self.recent.pop(key)
+                return True
+            if key not in self.bloom:
+                return False
+        return None
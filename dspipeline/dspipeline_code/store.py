@@ -0,0 +1,140 @@
+import logging
+import threading
+import time
+import pymongo
+from pymongo import UpdateOne
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+log = logging.getLogger(__name__)
+
+
+def insert_if_absent(collection, docs):
+    """ Summary: Store documents whose _id is not in the collection yet, in one
+        round trip: an upsert with $setOnInsert per document, so a document
+        already there (or stored concurrently) is left as it is.
+        INPUT: pymongo Collection: Where to write.
+               list of dicts: Documents with an _id.
+        OUTPUT: int: Number of documents inserted.
+    """
+    if not docs:
+        return 0
+    requests = [UpdateOne({'_id': doc['_id']},
+                          {'$setOnInsert': dict((k, v) for k, v in doc.items() if k != '_id')},
+                          upsert=True)
+                for doc in docs]
+    try:
+        return collection.bulk_write(requests, ordered=False).upserted_count
+    except pymongo.errors.BulkWriteError as e:
+        # 11000: two upserts of one new _id raced, the other one stored it
+        if any(error['code'] != 11000 for error in e.details['writeErrors']):
+            raise
+        return e.details['nUpserted']
+
+
+class BackgroundWriter(object):
+    """ Summary: Writes documents to Mongo from a thread of its own, so the
+        request that produced them does not wait for the database.
+
+        Documents wait in a bounded buffer and go out with insert_if_absent
+        in batches of up to batch_size, at most flush_interval seconds after
+        the first of them arrived. While Mongo is unreachable the batch is
+        retried, for up to max_retry seconds before it is dropped, and the
+        buffer fills up, put() then refuses documents instead of blocking,
+        so the caller can answer 503.
+
+        on_written, if given, is called with each batch once it is stored
+        (on the writer's thread), never with a dropped one.
+    """
+
+    def __init__(self, collection, max_buffer=10000, batch_size=1000, flush_interval=0.2,
+                 max_retry=60, on_written=None):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retry = max_retry
+        self.on_written = on_written
+        self.queue = queue.Queue(max_buffer)
+        self.written = 0
+        self.refused = 0
+        self.thread = threading.Thread(target=self._run, name='BackgroundWriter')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def put(self, doc):
+        """Buffer a document, False if the buffer is full."""
+        try:
+            self.queue.put_nowait(doc)
+            return True
+        except queue.Full:
+            self.refused += 1
+            return False
+
+    def flush(self):
+        """Block until every document buffered so far is written."""
+        self.queue.join()
+
+    def close(self, timeout=10):
+        """Write what is buffered and stop the thread, waiting at most about
+        timeout seconds: with Mongo down, what is left is dropped."""
+        if not self.thread.is_alive():
+            return
+        deadline = time.time() + timeout
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            log.error('Write buffer full at exit, dropped %d documents', self.queue.qsize())
+            return
+        self.thread.join(max(0, deadline - time.time()))
+        if self.thread.is_alive():
+            log.error('Writer still busy at exit, dropped %d documents', self.queue.qsize())
+
+    def _batch(self):
+        docs = [self.queue.get()]
+        deadline = time.time() + self.flush_interval
+        while docs[-1] is not None and len(docs) < self.batch_size:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                docs.append(self.queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return docs
+
+    def _write(self, docs):
+        """Store docs, True once they are, False if they were dropped."""
+        deadline = time.time() + self.max_retry
+        while True:
+            try:
+                self.written += insert_if_absent(self.collection, docs)
+                return True
+            except pymongo.errors.ConnectionFailure:
+                if time.time() >= deadline:
+                    log.exception('Mongo unreachable for %ds, dropped %d documents',
+                                  self.max_retry, len(docs))
+                    return False
+                log.warning('Mongo unreachable, retrying %d documents', len(docs))
+                time.sleep(self.flush_interval)
+            except pymongo.errors.PyMongoError:
+                log.exception('Dropped %d documents', len(docs))
+                return False
+
+    def _run(self):
+        while True:
+            docs = self._batch()
+            stop = docs[-1] is None
+            if stop:
+                docs.pop()
+            if self._write(docs) and docs and self.on_written is not None:
+                try:
+                    self.on_written(docs)
+                except Exception:
+                    log.exception('on_written failed')
+            for _ in range(len(docs) + stop):
+                self.queue.task_done()
+            if stop:
+                return